@@ -49,10 +49,11 @@ class AnimationManager:
         # within the Animation class.
         currentAnimation.previousFrame = -1
 
-    def update(self):
-        # Calls the update method of the current animation.
+    def update(self, frames = 1):
+        # Calls the update method of the current animation. The frames
+        # argument is the number of frames since this was last called.
         self.currentAnimationObject = self.animations[self.currentAnimation]
-        self.currentAnimationObject.update(self.user)
+        self.currentAnimationObject.update(self.user, frames)
 
     def get_frame(self):
         # Returns a surface - the current animation frame.
@@ -86,12 +87,13 @@ class Animation:
         self.previousFrame = -1
         self.justChangedFrame = False
 
-    def update(self, user):
+    def update(self, user, frames = 1):
         # Increases the timer by self.speed
+        # for each frame that has passed
         # and wraps the timer back around to
         # the start of the animation if we
         # reach the end.
-        self.timer += self.speed
+        self.timer += self.speed * frames
         self.timer %= len(self.sprites)
 
         self.justChangedFrame = False
@@ -151,7 +153,7 @@ class RotationalAnimation(Animation):
         super().__init__(app, speed, *self.spritesForEachDirection[0], sounds = sounds)
         self.rotationOffset = rotationOffset
 
-    def update(self, user):
+    def update(self, user, frames = 1):
         # Here we calculate which set of frames to use based on the
         # user's rotation value.
         rotation = user.rotation
@@ -160,7 +162,7 @@ class RotationalAnimation(Animation):
         # Then we update self.sprites with the correct set of frames,
         # to be processed by the rest of the code from the Animation class
         self.sprites = self.spritesForEachDirection[rotationIndex]
-        super().update(user)
+        super().update(user, frames)
 
 # This is a helpful .json file containing frame indices for commonly used animation
 # types, to save me from having to write them out every time I want to use them.
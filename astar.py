@@ -1,4 +1,6 @@
-import pygame
+import pygame, heapq, math, time
+from collections import OrderedDict
+import numpy as np
 
 from util import *
 from circles import *
@@ -10,7 +12,10 @@ class Graph:
         self.nodes = []
 
     def add_node(self, node):
-        # Adds a node to self.nodes.
+        # Adds a node to self.nodes. Each node stores its index in
+        # self.nodes, which AStarPathfinder uses to store information
+        # about nodes in lists instead of on the nodes themselves.
+        node.index = len(self.nodes)
         self.nodes.append(node)
 
     def add_edge(self, node1, node2):
@@ -54,27 +59,20 @@ class Graph:
         for node in self.nodes:
             node.remove_neighbour(nodeToRemove)
         self.nodes.pop(index)
-    
-    def reset_costs(self):
-        # Resets the g and h cost values of all nodes in
-        # self.nodes.
-        for node in self.nodes:
-            node.reset_costs()
+        # The nodes after the removed one have moved back one place.
+        for i in range(index, len(self.nodes)):
+            self.nodes[i].index = i
 
 class GraphNode:
     # Used by Graphs.
-    # Also stores some information relating to A* pathfinding.
     def __init__(self, app, pos):
         self.app = app
 
         self.pos = pos
         self.neighbours = []
-        # g and h cost are values used in A* pathfinding.
-        self.g = 0
-        self.h = 0
-        # self.parent is used to retrace the path found using
-        # A* pathfinding.
-        self.parent = None
+        # This node's position in its Graph's list of nodes.
+        # It is set by Graph.add_node().
+        self.index = None
 
     def add_neighbour(self, node):
         # Adds a node as a neighbour of this node.
@@ -86,11 +84,6 @@ class GraphNode:
         # Removes a node as a neighbour.
         if node in self.neighbours:
             self.neighbours.remove(node)
-    
-    def reset_costs(self):
-        # Resets g and h ready for another path to be found.
-        self.g = 0
-        self.h = 0
 
 class AStarPathfinder:
     # Uses a graph to find the shortest path between two nodes.
@@ -98,8 +91,103 @@ class AStarPathfinder:
         self.app = app
         # self.graph will be set when self.setup_graph is called.
         self.graph = None
+        # If paths are precomputed (see self.build_next_hops()), this is a
+        # table where self.nextHops[i][j] is the index of the first node
+        # after node i on the shortest path to node j. Otherwise it is None.
+        self.nextHops = None
+        # Most enemies pathfind towards the player, so if paths aren't
+        # precomputed we keep a flow field towards the player's boundary
+        # (see self.update_flow_field()).
+        # self.flowField[i] is the index of the next node after node i on
+        # the shortest path to node self.flowFieldTarget.
+        self.flowField = None
+        self.flowFieldTarget = None
+        # Enemies usually ask for the same path for many frames in a row, so
+        # if paths aren't precomputed, we remember the first node of recently
+        # found paths that the flow field doesn't cover. self.pathCache
+        # is an OrderedDict, which remembers the order its keys were added
+        # in. Its keys are (start node index, end node index) pairs, and the
+        # least recently used path is first.
+        # self.pathCacheHits and self.pathCacheMisses count how many times a
+        # path was or wasn't in the cache since the level was loaded.
+        self.pathCache = OrderedDict()
+        self.pathCacheSize = PATHCACHESIZE
+        self.pathCacheHits = 0
+        self.pathCacheMisses = 0
+        # self.pathRequests stores a PathRequest for each object that has
+        # called self.request_path() recently (see self.update()).
+        self.pathRequests = {}
+        self.pathfindingBudget = PATHFINDINGBUDGET
+        # The number of times self.update() has been called.
+        self.frame = 0
+
+    def request_path(self, obj, targetPos, targetObj):
+        # Does the same as self.pathfind(), but instead of finding a path
+        # straight away, returns a vector towards the waypoint found the last
+        # time this object requested a path. New paths are found in
+        # self.update(), which only spends a limited amount of time on them
+        # each frame, no matter how many enemies are following the player.
+        request = self.pathRequests.get(obj)
+        if request is None:
+            # If this object doesn't have a path yet, we have to find one now
+            # so that it doesn't stand still while it waits.
+            request = PathRequest(obj, targetPos, targetObj)
+            request.set_waypoint(self.get_waypoint(obj, targetPos, targetObj), self.frame)
+            self.pathRequests[obj] = request
+        else:
+            request.targetPos = targetPos
+            request.targetObj = targetObj
+        request.lastRequestedFrame = self.frame
+        return self.get_direction(obj, request.get_waypoint())
+
+    def update(self):
+        # Finds new paths for objects that have requested them with
+        # self.request_path() since their path was last found.
+        # Objects on the screen are dealt with first, then the ones whose paths
+        # are the oldest. We stop once we have spent self.pathfindingBudget
+        # milliseconds, and carry on with the rest on the next frame.
+        startTime = time.perf_counter()
+        requests = []
+        for obj, request in list(self.pathRequests.items()):
+            # Objects that stopped requesting paths (for example because they
+            # stopped following the player or were removed) are forgotten.
+            if self.frame - request.lastRequestedFrame > PATHREQUESTTIMEOUT:
+                del self.pathRequests[obj]
+            elif request.lastRequestedFrame > request.lastPlannedFrame:
+                requests.append(request)
+        requests.sort(key = lambda request: (
+            not self.app.camera.get_on_screen(request.obj),
+            request.lastPlannedFrame
+        ))
+        for request in requests:
+            request.set_waypoint(
+                self.get_waypoint(request.obj, request.targetPos, request.targetObj),
+                self.frame
+            )
+            if (time.perf_counter() - startTime) * 1000 >= self.pathfindingBudget: break
+        self.frame += 1
     
     def pathfind(self, obj, targetPos, targetObj):
+        # Returns a vector with a length of 1 pointing in the direction obj
+        # should move in to get to targetPos, or a vector of (0, 0) if it
+        # can't get there.
+        return self.get_direction(obj, self.get_waypoint(obj, targetPos, targetObj))
+
+    def get_direction(self, obj, waypoint):
+        # Returns the vector with a length of 1 pointing from an object
+        # to a waypoint (see self.get_waypoint()).
+        if waypoint is None: return pygame.math.Vector2()
+        vector = waypoint - obj.pos
+        # If we try to normalise a vector of length 0, pygame throws an error.
+        # Normalising is when you scale the vector to have a length of 1.
+        if vector.magnitude_squared() == 0: return pygame.math.Vector2()
+        return vector.normalize()
+
+    def get_waypoint(self, obj, targetPos, targetObj):
+        # Returns the position obj should head towards to get to targetPos.
+        # This is targetPos itself if they are on the same boundary, the
+        # position of the next node in the path otherwise, or None if obj
+        # can't get to targetPos.
         # First we create a new Circle object, using the target object's
         # position and radius. This is done so we can find which boundary
         # the circle is currently on.
@@ -107,7 +195,6 @@ class AStarPathfinder:
         # to store the last position they saw the player at and pathfind
         # towards that.
         targetCircle = Circle(self.app, targetPos, targetObj.radius)
-        targetCircle.find_overlapping_grid_spaces()
 
         # Here we find the boundaries that the pathfinding object and the target
         # object can be considered to be standing on. This is important because
@@ -117,8 +204,8 @@ class AStarPathfinder:
         startBoundary = self.get_current_boundary(obj)
         endBoundary = self.get_current_boundary(targetCircle)
         # If for some reason the player and the enemy aren't touching any boundaries,
-        # we just return a vector of (0, 0), so the pathfinding object doesn't move.
-        if startBoundary is None or endBoundary is None: return pygame.math.Vector2()
+        # we just return None, so the pathfinding object doesn't move.
+        if startBoundary is None or endBoundary is None: return None
 
         # Each boundary in the level has an associated node in self.graph.
         # We access this here, so we can calculate the shortest path between them.
@@ -128,103 +215,210 @@ class AStarPathfinder:
         # If the start node is the same as the end node, then we should just head
         # straight towards the target object as it is within the same boundary as
         # the pathfinding object.
-        if startNode == endNode:
-            vector = targetPos - obj.pos
-            # If we try to normalise a vector of length 0, pygame throws an error.
-            # Normalising is when you scale the vector to have a length of 1.
-            if vector.magnitude_squared() == 0: return pygame.math.Vector2()
-            return vector.normalize()
-
-        # These are the two lists that will be used to keep track of which
-        # nodes we need to check and and which we don't need to check.
-        openList = []
-        closedList = []
-        # We need to reset all of the cost values of all of the nodes in the
-        # graph back to 0 before we use it again. The nodes will still be
-        # storing their cost values from the last time we used them.
-        self.graph.reset_costs()
-        # We append the start node to the open list so we check it first, making
-        # sure to calculate its heuristic value.
-        startNode.h = self.heuristic(startNode, endNode.pos)
-        openList.append(startNode)
+        if startNode == endNode: return targetPos
+
+        # self.get_first_node_in_path() finds the shortest path between the
+        # nodes and returns the first node in the path after the start node.
+        # This node's position is the position the pathfinding object should
+        # head towards.
+        firstNodeInPath = self.get_first_node_in_path(startNode, endNode)
+        # If there isn't a path, return None. In theory this shouldn't
+        # happen, but just in case we have this failsafe.
+        if firstNodeInPath is None: return None
+        return firstNodeInPath.pos
+    
+    def get_first_node_in_path(self, startNode, endNode):
+        # Finds the shortest path from startNode to endNode, and returns the
+        # first node in the path after startNode. Returns None if there is
+        # no path.
+        # If the end node is the target of the flow field, or we have already
+        # worked out the first node of every path, we can just look it up.
+        if self.flowField is not None and endNode.index == self.flowFieldTarget:
+            nextHop = self.flowField[startNode.index]
+            if nextHop < 0: return None
+            return self.graph.nodes[nextHop]
+        if self.nextHops is not None:
+            nextHop = self.nextHops[startNode.index][endNode.index]
+            if nextHop < 0: return None
+            return self.graph.nodes[nextHop]
+
+        # Otherwise, we check whether we have found this path recently.
+        key = (startNode.index, endNode.index)
+        if key in self.pathCache:
+            self.pathCacheHits += 1
+            # This path is now the most recently used one.
+            self.pathCache.move_to_end(key)
+            return self.pathCache[key]
+        
+        # If not, we search for it and remember the result, forgetting the
+        # least recently used path if the cache is full.
+        self.pathCacheMisses += 1
+        firstNodeInPath = self.search(startNode, endNode)
+        self.pathCache[key] = firstNodeInPath
+        if len(self.pathCache) > self.pathCacheSize: self.pathCache.popitem(last = False)
+        return firstNodeInPath
+
+    def search(self, startNode, endNode):
+        # Uses A* pathfinding to find the shortest path from startNode to
+        # endNode, and returns the first node in the path after startNode.
+        # Returns None if there is no path.
+        # Information about each node is stored in lists, using the node's
+        # index in self.graph.nodes. These are created for each search, so
+        # nothing needs to be reset afterwards.
+        # - gCosts stores the length of the shortest path found so far from
+        #   the start node to each node.
+        # - fCosts stores each node's g cost plus its heuristic value, which
+        #   is an estimate of the length of the shortest path through the node.
+        # - parents stores the index of the node before each node in the
+        #   shortest path found so far. This is used to retrace the path.
+        nodes = self.graph.nodes
+        gCosts = [math.inf] * len(nodes)
+        fCosts = [math.inf] * len(nodes)
+        parents = [None] * len(nodes)
+        # The set of nodes whose shortest path has already been found,
+        # so we don't need to check them again.
+        closedSet = set()
+
+        # The open list is a heap (see Python's heapq module) of (f cost, index)
+        # pairs. A heap always keeps its smallest item first, so we can quickly
+        # pop the node with the lowest f cost without sorting the whole list.
+        gCosts[startNode.index] = 0
+        fCosts[startNode.index] = self.heuristic(startNode, endNode.pos)
+        openList = [(fCosts[startNode.index], startNode.index)]
 
         # Now we start pathfinding!
-        while True:
-            # If the open list is empty, return an empty vector.
-            # In theory this shouldn't happen, but just in case
-            # we have this failsafe.
-            if not openList: return pygame.math.Vector2()
+        while openList:
             # Pop the lowest cost node from the open list.
-            current = openList.pop(0)
+            f, index = heapq.heappop(openList)
+            # When we find a shorter path to a node that is already in the open
+            # list, we add it again instead of searching for it in the heap. So
+            # a node can be popped more than once, and we skip the old copies.
+            if index in closedSet or f > fCosts[index]: continue
             # If this node is the end node, we have reached the
-            # end of the path, so break the loop.
-            if current == endNode: break
-            # We shouldn't check this node again next iteration,
-            # so we add it to the closed list.
-            closedList.append(current)
+            # end of the path.
+            if index == endNode.index: return self.retrace_path(nodes, parents, index, startNode.index)
+            closedSet.add(index)
+            current = nodes[index]
             # Iterate through all of the neighbours of the current
             # node.
             for neighbour in current.neighbours:
-                # Calculate a new cost for the current node using
-                # its g and h costs.
-                cost = current.g + current.h
-                if neighbour in openList and cost < neighbour.g:
-                    # If the neighbour is in the open list and its g cost is
-                    # lower than the current node's calculated cost, we remove
-                    # it from the open list because we are already on a better
-                    # path than it is.
-                    openList.remove(neighbour)
-                elif not neighbour in openList and not neighbour in closedList:
-                    # If the neighbour isn't already open and it isn't closed
-                    # we can add it to the open list because it could be on the
-                    # shortest path. We give it a g and a h cost and add it to
-                    # the open list.
-                    neighbour.g = cost
-                    neighbour.h = self.heuristic(neighbour, endNode.pos)
-                    openList.append(neighbour)
-                    # Then we sort the open list by each node's g cost + h cost
-                    # (known as the node's f cost). This allows us to pop the
-                    # lowest cost node from the open list back at the start of
-                    # the while loop.
-                    openList.sort(key = lambda x: x.g + x.h)
-                    # We the set the neighbour node's parent to the current node.
+                if neighbour.index in closedSet: continue
+                # The cost of getting to the neighbour through the current
+                # node is the current node's g cost plus the length of the
+                # edge between them.
+                cost = gCosts[index] + current.pos.distance_to(neighbour.pos)
+                # If this is shorter than any path to the neighbour we have
+                # found before, we store it and add the neighbour to the open list.
+                if cost < gCosts[neighbour.index]:
+                    gCosts[neighbour.index] = cost
+                    fCosts[neighbour.index] = cost + self.heuristic(neighbour, endNode.pos)
+                    # We set the neighbour node's parent to the current node.
                     # This allows us to trace the path back to the start.
-                    neighbour.parent = current
-        
-        # self.retrace_path() returns the first node in the path after
-        # the start node. This node's position is the position that the
-        # vector we are trying to eventually calculate will point towards.
-        firstNodeInPath = self.retrace_path(current, startNode)
-        # Another failsafe.
-        if firstNodeInPath is None: return pygame.math.Vector2()
-
-        # Now we calculate the vector between the pathfinding object's
-        # position and the position of the first node in the path.
-        vector = firstNodeInPath.pos - obj.pos
-        # We also normalise this vector - it is now the vector pointing
-        # from the pathfinding object to the first node in the path.
-        if vector.magnitude_squared() == 0: return pygame.math.Vector2()
-        return vector.normalize()
+                    parents[neighbour.index] = index
+                    heapq.heappush(openList, (fCosts[neighbour.index], neighbour.index))
+        return None
     
     def get_current_boundary(self, obj):
         # Looks at all of the boundaries an object is touching, and returns the
         # closest one to that object.
-        nearbyBoundaries = self.app.levelContainer.boundaryHandler.get_nearby(obj)
+        boundaryHandler = self.app.levelContainer.boundaryHandler
+        nearbyBoundaries = boundaryHandler.get_nearby(obj)
         nearbyBoundaries = [i for i in nearbyBoundaries if i.get_colliding(obj)]
         # If the object isn't near any boundaries, find the nearest boundary
         # and return it.
-        if not nearbyBoundaries:
-            return sorted(
-                self.app.levelContainer.boundaryHandler.boundaries,
-                key = lambda x: x.pos.distance_to(obj.pos)
-            )[0]
-        nearbyBoundaries = sorted(nearbyBoundaries, key = lambda x: x.pos.distance_to(obj.pos))
-        return nearbyBoundaries[0]
-
-    def setup_graph(self, nodes, edges):
+        if not nearbyBoundaries: return boundaryHandler.get_nearest_boundary(obj.pos)
+        return min(nearbyBoundaries, key = lambda x: x.pos.distance_squared_to(obj.pos))
+
+    def setup_graph(self, nodes, edges, precomputePaths = PRECOMPUTEPATHS):
         # Creates a graph and adds the provided nodes and edges to it.
         self.graph = Graph(self.app)
         self.graph.add_nodes_and_edges(nodes, edges)
+        if precomputePaths: self.nextHops = self.build_next_hops()
+        else: self.nextHops = None
+        self.flowField = None
+        self.flowFieldTarget = None
+        # The paths in the cache were for the last level's graph.
+        self.pathCache.clear()
+        self.pathCacheHits = 0
+        self.pathCacheMisses = 0
+        self.pathRequests = {}
+
+    def update_flow_field(self, targetObj):
+        # Makes sure self.flowField leads to the boundary the given object
+        # is on. This is called once per frame with the player, so that every
+        # enemy following the player can share one search instead of each
+        # doing their own. The flow field is only rebuilt when the object
+        # moves onto a different boundary.
+        # If paths are precomputed, self.nextHops already has the first node
+        # of every path, so we don't need a flow field.
+        if self.graph is None or self.nextHops is not None: return
+        boundary = self.get_current_boundary(targetObj)
+        if boundary is None or boundary.nodeIndex == self.flowFieldTarget: return
+        self.flowFieldTarget = boundary.nodeIndex
+        self.flowField = self.build_flow_field(self.graph.nodes[boundary.nodeIndex])
+
+    def build_flow_field(self, targetNode):
+        # Uses Dijkstra's algorithm to find the shortest path from every node
+        # to targetNode. This is like A* (see self.search()), but without a
+        # heuristic, and starting from the target so that one search finds
+        # the paths from all of the other nodes.
+        # Returns a list where the item at index i is the index of the next
+        # node after node i on the shortest path to targetNode, or -1 if
+        # there is no path. Because the search starts at the target, the node
+        # each node was reached from is the next node on its path.
+        nodes = self.graph.nodes
+        gCosts = [math.inf] * len(nodes)
+        nextHops = [-1] * len(nodes)
+        closedSet = set()
+
+        gCosts[targetNode.index] = 0
+        nextHops[targetNode.index] = targetNode.index
+        openList = [(0, targetNode.index)]
+        while openList:
+            g, index = heapq.heappop(openList)
+            if index in closedSet or g > gCosts[index]: continue
+            closedSet.add(index)
+            current = nodes[index]
+            for neighbour in current.neighbours:
+                if neighbour.index in closedSet: continue
+                cost = g + current.pos.distance_to(neighbour.pos)
+                if cost < gCosts[neighbour.index]:
+                    gCosts[neighbour.index] = cost
+                    nextHops[neighbour.index] = index
+                    heapq.heappush(openList, (cost, neighbour.index))
+        return nextHops
+
+    def build_next_hops(self):
+        # Works out the first node after every node on the shortest path to
+        # every other node, using the Floyd-Warshall algorithm. This takes
+        # a while for large graphs, but is only done once per level, and
+        # then finding the next node in a path is just a lookup.
+        # Returns a list of lists, where nextHops[i][j] is the index of the
+        # first node after node i on the shortest path to node j, or -1 if
+        # there is no path.
+        nodes = self.graph.nodes
+        nodeCount = len(nodes)
+        # distances[i, j] is the length of the shortest path found so far
+        # from node i to node j. To start with, the only paths we know
+        # about are the edges.
+        distances = np.full((nodeCount, nodeCount), np.inf)
+        nextHops = np.full((nodeCount, nodeCount), -1)
+        for node in nodes:
+            distances[node.index, node.index] = 0
+            nextHops[node.index, node.index] = node.index
+            for neighbour in node.neighbours:
+                distances[node.index, neighbour.index] = node.pos.distance_to(neighbour.pos)
+                nextHops[node.index, neighbour.index] = neighbour.index
+        # Then, for each node k, we check whether going through node k makes
+        # the path between any pair of nodes shorter. NumPy lets us check
+        # every pair at once. If the path from i to j is shorter through k,
+        # its first step is the same as the first step from i to k.
+        for k in range(nodeCount):
+            throughK = distances[:, k, None] + distances[None, k, :]
+            shorter = throughK < distances
+            distances[shorter] = throughK[shorter]
+            nextHops[shorter] = np.broadcast_to(nextHops[:, k, None], nextHops.shape)[shorter]
+        return nextHops.tolist()
 
     def heuristic(self, current, target):
         # Calculates a value that will be used to eliminate
@@ -235,10 +429,39 @@ class AStarPathfinder:
         # the direct distance to the target position.
         return current.pos.distance_to(target)
 
-    def retrace_path(self, current, startNode):
-        # Uses the parent attribute of GraphNodes to retrace
-        # the path we have found back to the first node in the
+    def retrace_path(self, nodes, parents, index, startIndex):
+        # Uses the list of parents from self.search() to
+        # retrace the path we have found back to the first node in the
         # path other than the starting node.
-        while True:
-            if current.parent is startNode: return current
-            else: current = current.parent
\ No newline at end of file
+        while parents[index] != startIndex:
+            index = parents[index]
+        return nodes[index]
+
+class PathRequest:
+    # Used by AStarPathfinder to remember the path an object asked for
+    # with AStarPathfinder.request_path(), and the last waypoint found for it.
+    def __init__(self, obj, targetPos, targetObj):
+        self.obj = obj
+        self.targetPos = targetPos
+        self.targetObj = targetObj
+        # The last waypoint found for this request (see
+        # AStarPathfinder.get_waypoint()), and whether it was the target
+        # position itself.
+        self.waypoint = None
+        self.headingForTarget = False
+        # The frames this request was last made and last had its path found.
+        self.lastRequestedFrame = 0
+        self.lastPlannedFrame = 0
+
+    def set_waypoint(self, waypoint, frame):
+        # Stores a new waypoint found on the given frame.
+        self.waypoint = waypoint
+        self.headingForTarget = waypoint is self.targetPos
+        self.lastPlannedFrame = frame
+
+    def get_waypoint(self):
+        # If the object was on the same boundary as its target, it heads
+        # straight for where the target is now rather than where it was
+        # when the path was found.
+        if self.headingForTarget: return self.targetPos
+        return self.waypoint
\ No newline at end of file
@@ -1,15 +1,35 @@
 import random
+import numpy as np
 
 from util import *
 from circles import *
+from kdtree import *
 
 class BoundaryHandler(PositionGridUser):
     # Stores boundaries and manages boundary updating, drawing, collisions etc.
-    def __init__(self, app, fillArguments):
-        super().__init__(app)
+    def __init__(self, app, fillArguments, useDistanceField = USEDISTANCEFIELD):
+        # Boundaries are much larger than objects, so they use a larger
+        # grid size (see PositionGridUser).
+        super().__init__(app, BOUNDARYGRIDSIZE)
 
         self.boundaries = []
 
+        # self.distanceField is a 2D NumPy array of distances from the edge of
+        # the level, built by self.build_distance_field() once all of the
+        # boundaries have been added. It is None until then.
+        # self.distanceFieldOrigin is the position of the array's first value.
+        self.distanceField = None
+        self.distanceFieldOrigin = (0, 0)
+        self.useDistanceField = useDistanceField
+        # self.boundaryData is a NumPy array with a row for each boundary,
+        # storing its x position, y position and radius. It is used by
+        # self.get_containment(), and is built when it is first needed.
+        self.boundaryData = None
+        # self.kdTree is a KDTree (see kdtree.py) of the boundaries'
+        # centres, used to find the nearest boundaries to a position.
+        # It is also built when it is first needed.
+        self.kdTree = None
+
         # These two surfaces are used to draw the boundaries to
         # the screen. The colourkey is white, meaning white areas
         # drawn to these surfaces will appear transparent when
@@ -39,14 +59,155 @@ class BoundaryHandler(PositionGridUser):
                 self.fillArguments.append(i)
     
     def add_boundary(self, boundary):
-        # Adds a boundary to self.boundaries and updates
-        # self.positionGrid to include this boundary.
-        self.boundaries.append(boundary)
-        self.update_position_grid(self.boundaries)
+        # Adds a boundary to self.boundaries and inserts it into
+        # self.positionGrid. Anything built from the list of boundaries
+        # is thrown away, and will be rebuilt by self.finalize() (or when
+        # it is next needed).
+        self.add_boundaries([boundary])
+
+    def add_boundaries(self, boundaries):
+        # Adds a list of boundaries at once. This should be used instead of
+        # calling self.add_boundary() lots of times when loading a level,
+        # followed by a call to self.finalize().
+        for boundary in boundaries:
+            boundary.boundaryIndex = len(self.boundaries)
+            self.boundaries.append(boundary)
+            self.insert_circle(boundary)
+        self.boundaryData = None
+        self.kdTree = None
+        self.distanceField = None
+
+    def finalize(self):
+        # Builds everything that depends on the whole list of boundaries:
+        # the array used by self.get_containment(), the KDTree used to find
+        # the nearest boundaries and the distance field. This should be
+        # called once, after all of the level's boundaries have been added.
+        self.build_boundary_data()
+        self.build_kd_tree()
+        self.build_distance_field()
+
+    def build_boundary_data(self):
+        # Builds self.boundaryData, which has a row for each boundary
+        # containing its x position, y position and radius.
+        self.boundaryData = np.array([
+            (boundary.pos.x, boundary.pos.y, boundary.radius)
+            for boundary in self.boundaries
+        ])
+
+    def build_kd_tree(self):
+        # Builds self.kdTree from the positions of the boundaries.
+        self.kdTree = KDTree(self.boundaries, [boundary.pos for boundary in self.boundaries])
+
+    def build_distance_field(self):
+        # Builds self.distanceField, which stores the signed distance from
+        # the edge of the level at points DISTANCEFIELDCELLSIZE pixels apart.
+        # The distance at a point is the smallest value of
+        # (distance to the centre of a boundary - radius of that boundary),
+        # so it is negative inside the level and positive outside it. A circle
+        # is completely inside one of the boundaries if the distance at its
+        # centre is less than -(its radius).
+        # Once this is built, finding out whether a point is inside the level
+        # only needs a few array lookups (see self.get_distance()), instead
+        # of checking every nearby boundary.
+        cellSize = DISTANCEFIELDCELLSIZE
+        band = DISTANCEFIELDBAND
+        # The field covers the level's bounding box, plus enough space around
+        # it to store distances up to DISTANCEFIELDBAND outside the level.
+        boundingBox = self.get_bounding_box()
+        left = boundingBox.left - band - cellSize
+        top = boundingBox.top - band - cellSize
+        width = int((boundingBox.width + 2 * (band + cellSize)) / cellSize) + 2
+        height = int((boundingBox.height + 2 * (band + cellSize)) / cellSize) + 2
+        self.distanceFieldOrigin = (left, top)
+        # Points further than DISTANCEFIELDBAND outside the level are
+        # given a distance of DISTANCEFIELDBAND. This means each boundary
+        # only has to update the part of the field within DISTANCEFIELDBAND
+        # of it, instead of the whole field.
+        field = np.full((height, width), band, dtype = np.float32)
+        for boundary in self.boundaries:
+            reach = boundary.radius + band
+            x1 = max(0, int((boundary.pos.x - reach - left) / cellSize))
+            x2 = min(width, int((boundary.pos.x + reach - left) / cellSize) + 2)
+            y1 = max(0, int((boundary.pos.y - reach - top) / cellSize))
+            y2 = min(height, int((boundary.pos.y + reach - top) / cellSize) + 2)
+            xs = left + np.arange(x1, x2) * cellSize - boundary.pos.x
+            ys = top + np.arange(y1, y2) * cellSize - boundary.pos.y
+            distances = np.sqrt(xs[None, :] ** 2 + ys[:, None] ** 2) - boundary.radius
+            np.minimum(field[y1:y2, x1:x2], distances, out = field[y1:y2, x1:x2])
+        np.minimum(field, band, out = field)
+        self.distanceField = field
+
+    def sample_distance_field(self, pos):
+        # Returns the distance from the edge of the level at a position,
+        # and the gradient of the distance field there. The gradient points
+        # in the direction the distance increases fastest, so it points out
+        # of the level. Positions between the points stored in
+        # self.distanceField use bilinear interpolation between the four
+        # points around them.
+        cellSize = DISTANCEFIELDCELLSIZE
+        x = (pos[0] - self.distanceFieldOrigin[0]) / cellSize
+        y = (pos[1] - self.distanceFieldOrigin[1]) / cellSize
+        height, width = self.distanceField.shape
+        # Anything outside of the field is at least DISTANCEFIELDBAND
+        # outside the level.
+        if not (0 <= x < width - 1 and 0 <= y < height - 1):
+            return DISTANCEFIELDBAND, pygame.math.Vector2()
+        column = int(x)
+        row = int(y)
+        x -= column
+        y -= row
+        ((topLeft, topRight), (bottomLeft, bottomRight)) = (
+            self.distanceField[row:row + 2, column:column + 2].tolist()
+        )
+        top = topLeft + (topRight - topLeft) * x
+        bottom = bottomLeft + (bottomRight - bottomLeft) * x
+        distance = top + (bottom - top) * y
+        gradient = pygame.math.Vector2(
+            ((topRight - topLeft) * (1 - y) + (bottomRight - bottomLeft) * y) / cellSize,
+            (bottom - top) / cellSize
+        )
+        return distance, gradient
+
+    def get_distance(self, pos):
+        # Returns the distance from the edge of the level at a position.
+        # This is negative inside the level (see self.build_distance_field()).
+        return self.sample_distance_field(pos)[0]
+
+    def get_walkable(self, pos, radius = 0):
+        # Returns whether a circle with the given position and radius is
+        # completely inside one of the boundaries. If the distance field
+        # hasn't been built yet, we check the nearby boundaries instead.
+        if self.distanceField is None:
+            return self.circle_inside_boundaries(Circle(self.app, pos, radius))
+        # The distance field is only accurate to within a few pixels where
+        # boundaries overlap, so if the circle is within a cell of the edge
+        # we check the nearby boundaries to be sure.
+        margin = self.get_distance(pos) + radius
+        if abs(margin) < DISTANCEFIELDCELLSIZE:
+            return self.circle_inside_boundaries(Circle(self.app, pos, radius))
+        return margin < 0
     
     def snap_inside_boundaries(self, obj):
         # Snap sthe given VerletObject inside of all of the
         # boundaries in self.boundaries.
+        # If the level has a distance field, we can usually use that instead
+        # of looking at the nearby boundaries.
+        if self.useDistanceField and self.distanceField is not None:
+            distance, gradient = self.sample_distance_field(obj.pos)
+            # Distances close to DISTANCEFIELDBAND aren't accurate (see
+            # self.build_distance_field()), so objects that far outside the
+            # level are snapped using the boundaries below.
+            if distance < DISTANCEFIELDBAND - DISTANCEFIELDCELLSIZE:
+                # The object is inside the level if its centre is at least
+                # its radius inside the edge.
+                overlap = distance + obj.radius
+                if overlap < 0 or gradient.magnitude_squared() == 0: return
+                # Otherwise we move it against the gradient (back into the
+                # level) by how far it is outside. As below, the snap is
+                # made softer by multiplying it by 0.3.
+                obj.pos -= gradient.normalize() * overlap * 0.3
+                return
+
         # First we find any boundaries that are nearby to the object.
         nearbyBoundaries = self.get_nearby(obj)
         
@@ -62,23 +223,26 @@ class BoundaryHandler(PositionGridUser):
         if nearbyBoundaries: obj.previousNearbyBoundaries = nearbyBoundaries
         else:
             if not obj.previousNearbyBoundaries:
-                obj.previousNearbyBoundaries.append(sorted(
-                    self.boundaries,
-                    key = lambda x: x.pos.distance_to(obj.pos)
-                )[0])
+                obj.previousNearbyBoundaries.append(self.get_nearest_boundary(obj.pos))
             nearbyBoundaries = obj.previousNearbyBoundaries
 
         # If the object is completely within any of its nearby boundaries, we do not
         # need to snap it back inside them so we can return from this method.
         # Also, if for some reason we still have an empty list of nearby boundaries, we return.
-        if not nearbyBoundaries or obj.get_within_boundaries(nearbyBoundaries): return
-
-        # Now we get all of the vectors that could move the object back inside of
-        # each nearby boundary. Then we choose the shortest vector.
-        snapVectors = []
-        for boundary in nearbyBoundaries:
-            snapVectors.append(boundary.get_snap_inside_vector(obj))
-        snapVector = sorted(snapVectors, key = lambda x: x.magnitude_squared())[0]
+        if not nearbyBoundaries: return
+        # If there are lots of nearby boundaries, we check all of them at once
+        # using NumPy (see self.get_containment()).
+        if len(nearbyBoundaries) >= CONTAINMENTNUMPYMINIMUM:
+            insideMask, snapVector = self.get_containment(obj, nearbyBoundaries)
+            if insideMask.all(): return
+        else:
+            if obj.get_within_boundaries(nearbyBoundaries): return
+            # Now we get all of the vectors that could move the object back inside of
+            # each nearby boundary. Then we choose the shortest vector.
+            snapVector = min(
+                [boundary.get_snap_inside_vector(obj) for boundary in nearbyBoundaries],
+                key = lambda x: x.magnitude_squared()
+            )
 
         # Finally we move the object's position by this vector.
         # The vector is multiplied by 0.3 here to make the snap back into the boundaries
@@ -87,6 +251,58 @@ class BoundaryHandler(PositionGridUser):
         # a wall and suddenly get shot back out.
         obj.pos += snapVector * 0.3
 
+    def get_containment(self, obj, nearbyBoundaries):
+        # Does the same as VerletObject.get_within_boundaries() and
+        # Boundary.get_snap_inside_vector(), but checks every nearby boundary
+        # at once using NumPy instead of looping over them in Python.
+        # Returns two things:
+        # - An array of booleans with one for each of the object's boundary
+        #   check points (see VerletObject.get_boundary_check_points()),
+        #   saying whether that point is inside any of the boundaries.
+        # - The shortest vector that moves the object back inside one of the
+        #   boundaries, which is (0, 0) if it is already inside one.
+        if self.boundaryData is None: self.build_boundary_data()
+        data = self.boundaryData[[boundary.boundaryIndex for boundary in nearbyBoundaries]]
+        centresX = data[:, 0]
+        centresY = data[:, 1]
+        radii = data[:, 2] - obj.radius
+
+        # First we find the distance from every point to every boundary's
+        # centre. This is a 2D array, with a row for each point and a
+        # column for each boundary.
+        points = np.array(obj.get_boundary_check_points())
+        pointDistances = np.hypot(
+            points[:, 0, None] - centresX,
+            points[:, 1, None] - centresY
+        )
+        insideMask = (pointDistances < radii).any(axis = 1)
+
+        # Then we work out how far the object would have to move to get inside
+        # each boundary. This is negative for boundaries the object is outside of.
+        displacementsX = obj.pos.x - centresX
+        displacementsY = obj.pos.y - centresY
+        distances = np.hypot(displacementsX, displacementsY)
+        snapMagnitudes = radii - distances
+        # If the object is inside any boundary (or exactly on its centre),
+        # the shortest snap vector is (0, 0).
+        if (snapMagnitudes >= 0).any() or not distances.all():
+            return insideMask, pygame.math.Vector2()
+        # Otherwise the shortest one is for the boundary with the largest
+        # (least negative) snap magnitude.
+        i = snapMagnitudes.argmax()
+        snapVector = pygame.math.Vector2(displacementsX[i], displacementsY[i])
+        return insideMask, snapVector * (snapMagnitudes[i] / distances[i])
+
+    def get_nearest_boundary(self, pos):
+        # Returns the boundary whose centre is nearest to a position.
+        return self.get_k_nearest_boundaries(pos, 1)[0]
+
+    def get_k_nearest_boundaries(self, pos, k):
+        # Returns a list of the k boundaries whose centres are nearest
+        # to a position, nearest first.
+        if self.kdTree is None: self.build_kd_tree()
+        return self.kdTree.get_k_nearest(pos, k)
+
     def circle_touching_boundaries(self, circle):
         # Returns whether the given circle is touching any of
         # its nearby boundaries.
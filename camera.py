@@ -13,6 +13,11 @@ class Camera:
         # This is the camera's actual position. Other positions will be
         # offset using this position.
         self.pos = pygame.math.Vector2(self.targetPos)
+        # The camera's position on the previous update, and the position
+        # it is drawn from, which is somewhere between self.previousPos
+        # and self.pos (see self.update_draw_pos()).
+        self.previousPos = pygame.math.Vector2(self.pos)
+        self.drawPos = pygame.math.Vector2(self.pos)
         # An object for the camera to track can be provided here. If an
         # object is provided, self.targetPos will be updated with the object's
         # position each frame.
@@ -33,10 +38,16 @@ class Camera:
         # Lerp is short for linear interpolation. In this case, we
         # move the camera 10% of the distance towards the target position
         # each frame, which results in a smooth movement.
+        self.previousPos.update(self.pos)
         self.pos.update(self.pos.lerp(targetPos, 0.1))
         # The shake factor decays exponentially over time.
         self.shakeFactor *= 0.9
 
+    def update_draw_pos(self):
+        # Updates the position the camera is drawn from, using how far we
+        # are between the last update and the next (see App.run()).
+        self.drawPos.update(self.previousPos.lerp(self.pos, self.app.interpolation))
+
     def set_target(self, obj):
         # Setting the target object
         self.target = obj
@@ -49,11 +60,20 @@ class Camera:
         # target.
         self.target = None
 
+    def get_on_screen(self, circle):
+        # Returns whether a circle is on the screen, or close to the
+        # edge of it.
+        offset = circle.pos - self.pos
+        return (
+            abs(offset.x) < WIDTH / 2 + circle.radius * 2 and
+            abs(offset.y) < HEIGHT / 2 + circle.radius * 2
+        )
+
     def adjust_pos(self, pos):
         # This method is used to calculate where on the screen
         # a given position should appear if everything is offset
         # by the camera's position.
-        return pos - self.pos + (WIDTH/2, HEIGHT/2)
+        return pos - self.drawPos + (WIDTH/2, HEIGHT/2)
 
     def blit(self, surface, pos):
         # This method blits a surface to the screen, offset by
@@ -2,16 +2,27 @@ import pygame, math
 
 from util import *
 
+def get_grid_key(x, y):
+    # Packs a pair of grid coordinates into a single integer, which is
+    # used as a key in PositionGridUser.positionGrid. Integers are cheaper
+    # to create, hash and compare than tuples of coordinates.
+    # This works for coordinates between -32768 and 32767, which is far
+    # larger than any level, even at the smallest grid size.
+    return (x + 32768) * 65536 + y + 32768
+
 class Circle:
     def __init__(self, app, pos, radius):
         self.app = app
 
         self.pos = pygame.math.Vector2(pos)
         self.radius = radius
-        # self.overlappingGridSpaces is a list of grid spaces that
-        # this circle is overlapping with. Its use is explained in
-        # the PositionGridUser class.
-        self.overlappingGridSpaces = []
+        # self.gridCache stores which grid spaces this circle is overlapping
+        # with (their use is explained in the PositionGridUser class). Its keys
+        # are grid sizes, and its values are lists of the form
+        # [x, y, radius, grid range, grid spaces]. These are reused until this
+        # circle moves or changes size enough to be in different grid spaces,
+        # so we don't need to work them out again every time they are needed.
+        self.gridCache = {}
 
     def get_overlap_vector(self, circle):
         # This method calculates the overlap vector between two circles.
@@ -29,58 +40,338 @@ class Circle:
         # Returns whether a circle is fully inside another circle.
         return (circle.pos - self.pos).magnitude() < (self.radius - circle.radius)
 
-    def find_overlapping_grid_spaces(self):
+    def get_grid_range(self, gridSize = GRIDSIZE):
+        # Returns the range of grid spaces covered by the bounding box
+        # of this circle, as (left, top, right, bottom), for a grid
+        # whose spaces are gridSize wide. Two calls giving the same range
+        # means the circle is in the same grid spaces, which PositionGridUser
+        # uses to avoid moving circles that haven't crossed into a different
+        # grid space.
+        x, y, radius = self.pos.x, self.pos.y, self.radius
+        cache = self.gridCache.get(gridSize)
+        # If this circle hasn't moved since the last call, the range
+        # can't have changed.
+        if cache and cache[0] == x and cache[1] == y and cache[2] == radius:
+            return cache[3]
+        gridRange = (
+            math.floor((x - radius) / gridSize),
+            math.floor((y - radius) / gridSize),
+            math.floor((x + radius) / gridSize),
+            math.floor((y + radius) / gridSize)
+        )
+        # If the circle has moved but is still within the same grid spaces,
+        # we keep the grid spaces we have already calculated.
+        if cache and cache[3] == gridRange:
+            cache[0], cache[1], cache[2] = x, y, radius
+        else:
+            self.gridCache[gridSize] = [x, y, radius, gridRange, None]
+        return gridRange
+
+    def find_overlapping_grid_spaces(self, gridSize = GRIDSIZE):
         # Using the bounding box of this circle, calculates which
         # grid spaces this circle is within. Used in PositionGridUser.
-        gridspaces = []
-        for y in range(math.floor((self.pos.y - self.radius) / GRIDSIZE), math.ceil((self.pos.y + self.radius) / GRIDSIZE) + 1):
-            for x in range(math.floor((self.pos.x - self.radius) / GRIDSIZE), math.ceil((self.pos.x + self.radius) / GRIDSIZE) + 1):
-                gridspaces.append((x, y))
-        self.overlappingGridSpaces = gridspaces
-        return gridspaces
+        # The list this returns is shared with self.gridCache, so it
+        # shouldn't be changed.
+        left, top, right, bottom = self.get_grid_range(gridSize)
+        cache = self.gridCache[gridSize]
+        if cache[4] is None:
+            cache[4] = [
+                get_grid_key(x, y)
+                for y in range(top, bottom + 1)
+                for x in range(left, right + 1)
+            ]
+        return cache[4]
 
 class PositionGridUser:
-    def __init__(self, app):
+    def __init__(self, app, gridSize = GRIDSIZE):
         self.app = app
+        # The width and height of each grid space. This should be chosen
+        # based on the size of the circles stored in the grid. If it is
+        # much smaller than the circles, each circle will be stored in lots
+        # of grid spaces, making the grid slow to build and query. If it is
+        # much larger, each grid space will hold lots of circles that aren't
+        # actually close to each other.
+        self.gridSize = gridSize
         # self.positionGrid is a dictionary. Its keys are grid coordinates,
-        # and its values are lists of objects that lie within the grid coordinates.
+        # packed into integers by get_grid_key(), and its values are lists of objects that lie within the grid coordinates.
         # This is used as part of an optimisation technique called spatial partitioning,
         # where you only check collisions with nearby objects. This massively cuts down
         # on collision checks, hugely helping performance.
         self.positionGrid = {}
+        # self.gridRanges is a dictionary storing the grid range (see
+        # Circle.get_grid_range()) that each circle was last inserted with,
+        # and self.gridSpaces stores the grid spaces it was inserted into.
+        # Together they let us move a circle between grid spaces only when
+        # it has actually crossed into different ones, instead of rebuilding
+        # self.positionGrid from scratch.
+        self.gridRanges = {}
+        self.gridSpaces = {}
+        self.pairCount = 0
 
     def update_position_grid(self, circles):
-        # Populates self.positionGrid with the provided circles.
+        # Populates self.positionGrid with the provided circles,
+        # throwing away anything that was in it before.
         self.positionGrid = {}
+        self.gridRanges = {}
+        self.gridSpaces = {}
         for circle in circles:
-            for gridspace in circle.find_overlapping_grid_spaces():
-                if not gridspace in self.positionGrid:
-                    self.positionGrid[gridspace] = []
-                self.positionGrid[gridspace].append(circle)
+            self.insert_circle(circle)
+
+    def insert_circle(self, circle):
+        # Adds a single circle to self.positionGrid.
+        # If the circle is already in the grid, it is removed first
+        # so it never ends up in the same grid space twice.
+        if circle in self.gridRanges: self.remove_circle(circle)
+        self.gridRanges[circle] = circle.get_grid_range(self.gridSize)
+        self.gridSpaces[circle] = circle.find_overlapping_grid_spaces(self.gridSize)
+        self.add_to_grid_spaces(circle, self.gridSpaces[circle])
+
+    def remove_circle(self, circle):
+        # Removes a single circle from self.positionGrid.
+        if not circle in self.gridRanges: return
+        del self.gridRanges[circle]
+        self.remove_from_grid_spaces(circle, self.gridSpaces.pop(circle))
+
+    def move_circle(self, circle):
+        # Updates a circle's place in self.positionGrid after it has moved.
+        # Most of the time a circle stays within the same grid spaces between
+        # frames, in which case we don't need to do anything.
+        gridRange = circle.get_grid_range(self.gridSize)
+        if self.gridRanges[circle] == gridRange: return
+        self.remove_from_grid_spaces(circle, self.gridSpaces[circle])
+        self.gridRanges[circle] = gridRange
+        self.gridSpaces[circle] = circle.find_overlapping_grid_spaces(self.gridSize)
+        self.add_to_grid_spaces(circle, self.gridSpaces[circle])
+
+    def move_all_circles(self):
+        # Calls self.move_circle() for every circle in the grid.
+        for circle in self.gridRanges:
+            self.move_circle(circle)
+
+    def add_to_grid_spaces(self, circle, gridspaces):
+        # Adds a circle to each of the given grid spaces.
+        for gridspace in gridspaces:
+            if not gridspace in self.positionGrid:
+                self.positionGrid[gridspace] = []
+            self.positionGrid[gridspace].append(circle)
+
+    def remove_from_grid_spaces(self, circle, gridspaces):
+        # Removes a circle from each of the given grid spaces.
+        # Grid spaces that become empty are deleted so that
+        # self.positionGrid doesn't keep growing as objects
+        # move around the level.
+        for gridspace in gridspaces:
+            gridspaceCircles = self.positionGrid[gridspace]
+            gridspaceCircles.remove(circle)
+            if not gridspaceCircles: del self.positionGrid[gridspace]
 
     def iterate_pairs(self):
         # Creates a generator using the yield keyword, that iterates
         # over each pair of circles that share a grid space.
-        # yieldedPairs keeps track of which pairs have already been yielded
-        # to prevent duplicates.
-        yieldedPairs = []
-        for i in self.positionGrid.values():
-            for a in range(len(i)):
-                for b in range(a+1, len(i)):
-                    circle1 = i[a]
-                    circle2 = i[b]
-                    # Checking for duplicates.
-                    if (circle1, circle2) in yieldedPairs or (circle2, circle1) in yieldedPairs: continue
-                    yieldedPairs.append((circle1, circle2))
+        # Two circles can share more than one grid space, so to prevent
+        # duplicates we only yield a pair from one of the grid spaces they
+        # share - the top left grid space of the area where their grid ranges
+        # overlap. This means each pair is yielded exactly once, without having
+        # to keep track of which pairs have already been yielded.
+        # self.pairCount is the number of pairs yielded by the last call of
+        # this method, which is useful for measuring how much work the
+        # collision checks are doing.
+        self.pairCount = 0
+        for gridspace, circles in self.positionGrid.items():
+            for a in range(len(circles)):
+                circle1 = circles[a]
+                left1, top1 = self.gridRanges[circle1][:2]
+                for b in range(a+1, len(circles)):
+                    circle2 = circles[b]
+                    left2, top2 = self.gridRanges[circle2][:2]
+                    # Checking that this grid space is the one that owns the pair.
+                    if gridspace != get_grid_key(max(left1, left2), max(top1, top2)): continue
+                    self.pairCount += 1
+                    yield circle1, circle2
+
+    def iterate_pairs_with(self, positionGridUser):
+        # Similar to self.iterate_pairs(), but iterates over each pair made
+        # up of one circle from this PositionGridUser and one circle from
+        # another PositionGridUser, where the two circles share a grid space.
+        # Pairs of circles that are both in the other PositionGridUser are
+        # never yielded. The same top left grid space rule is used to prevent
+        # duplicates, so both PositionGridUsers must use the same grid size.
+        for circle1, gridspaces in self.gridSpaces.items():
+            left1, top1 = self.gridRanges[circle1][:2]
+            for gridspace in gridspaces:
+                if not gridspace in positionGridUser.positionGrid: continue
+                for circle2 in positionGridUser.positionGrid[gridspace]:
+                    left2, top2 = positionGridUser.gridRanges[circle2][:2]
+                    if gridspace != get_grid_key(max(left1, left2), max(top1, top2)): continue
                     yield circle1, circle2
 
     def get_nearby(self, circle):
         # Gets a list of circles that share a grid space with
         # the given circle.
+        # Like in self.iterate_pairs(), each nearby circle is only added
+        # from the top left grid space that it shares with the given circle,
+        # so it can't be added to the list more than once.
         nearby = []
-        for gridspace in circle.find_overlapping_grid_spaces():
+        left1, top1 = circle.get_grid_range(self.gridSize)[:2]
+        for gridspace in circle.find_overlapping_grid_spaces(self.gridSize):
             if not gridspace in self.positionGrid: continue
             for i in self.positionGrid[gridspace]:
-                if i != circle and not i in nearby:
-                    nearby.append(i)
-        return nearby
\ No newline at end of file
+                if i == circle: continue
+                left2, top2 = self.gridRanges[i][:2]
+                if gridspace != get_grid_key(max(left1, left2), max(top1, top2)): continue
+                nearby.append(i)
+        return nearby
+
+    def get_in_radius(self, pos, radius):
+        # Gets a list of circles whose centres are within the given
+        # distance of a position.
+        # If there are fewer circles in the grid than there are grid spaces
+        # in the area we are searching, it is quicker to check every circle.
+        left = math.floor((pos[0] - radius) / self.gridSize)
+        top = math.floor((pos[1] - radius) / self.gridSize)
+        right = math.floor((pos[0] + radius) / self.gridSize)
+        bottom = math.floor((pos[1] + radius) / self.gridSize)
+        if len(self.gridRanges) < (right - left + 1) * (bottom - top + 1):
+            circles = self.gridRanges
+        else:
+            # A circle can be in more than one grid space, so we use
+            # a set to avoid adding it more than once.
+            circles = set()
+            for x in range(left, right + 1):
+                for y in range(top, bottom + 1):
+                    gridspace = get_grid_key(x, y)
+                    if gridspace in self.positionGrid:
+                        circles.update(self.positionGrid[gridspace])
+        return [
+            circle for circle in circles
+            if circle.pos.distance_squared_to(pos) <= radius ** 2
+        ]
+
+class SweepAndPrune:
+    # An alternative to PositionGridUser for finding pairs of nearby circles.
+    # Circles are kept in a list sorted by the left edge of their bounding box.
+    # To find the pairs of circles whose bounding boxes overlap, we "sweep"
+    # along this list from left to right. For each circle, we only need to
+    # look at the circles after it in the list until we reach one whose left
+    # edge is past this circle's right edge, because every circle after that
+    # one is even further to the right.
+    # Unlike a grid, this doesn't depend on the size of the circles, and it
+    # works well when lots of circles are crowded together.
+    def __init__(self, app):
+        self.app = app
+        # self.circles is the sorted list of circles. self.lefts and
+        # self.rights are the left and right edges of the bounding box of
+        # each circle in self.circles, calculated in self.move_all_circles().
+        self.circles = []
+        self.lefts = []
+        self.rights = []
+        # self.circleSet holds the same circles as self.circles, so we can
+        # quickly check whether a circle has been added. Removing a circle
+        # from the middle of self.circles would mean searching for it and
+        # moving every circle after it, so instead removed circles are put in
+        # self.removedCircles and taken out of self.circles all at once in
+        # self.move_all_circles().
+        self.circleSet = set()
+        self.removedCircles = set()
+        self.pairCount = 0
+
+    def insert_circle(self, circle):
+        # Adds a circle to the end of self.circles. It will be moved to
+        # its correct place the next time self.move_all_circles() is called.
+        if circle in self.circleSet: return
+        self.circleSet.add(circle)
+        # If the circle was removed since the last call of
+        # self.move_all_circles(), it is still in self.circles.
+        if circle in self.removedCircles:
+            self.removedCircles.discard(circle)
+            return
+        self.circles.append(circle)
+        self.lefts.append(circle.pos.x - circle.radius)
+        self.rights.append(circle.pos.x + circle.radius)
+
+    def remove_circle(self, circle):
+        # Removes a circle. It is taken out of self.circles the next time
+        # self.move_all_circles() is called.
+        if not circle in self.circleSet: return
+        self.circleSet.discard(circle)
+        self.removedCircles.add(circle)
+
+    def move_all_circles(self):
+        # Takes any removed circles out of self.circles, then recalculates
+        # the bounding box edges of every circle and sorts the circles again.
+        if self.removedCircles:
+            self.circles = [circle for circle in self.circles if not circle in self.removedCircles]
+            self.removedCircles = set()
+        circles = self.circles
+        lefts = [circle.pos.x - circle.radius for circle in circles]
+        rights = [circle.pos.x + circle.radius for circle in circles]
+        # We use insertion sort because the order of the circles is kept
+        # between frames. Circles only move a small distance each frame, so
+        # the list will already be almost sorted. Insertion sort is very fast
+        # on almost sorted lists - it only needs to move the few circles that
+        # have swapped places since the last frame.
+        for i in range(1, len(circles)):
+            left = lefts[i]
+            if lefts[i - 1] <= left: continue
+            circle = circles[i]
+            right = rights[i]
+            j = i - 1
+            while j >= 0 and lefts[j] > left:
+                circles[j + 1] = circles[j]
+                lefts[j + 1] = lefts[j]
+                rights[j + 1] = rights[j]
+                j -= 1
+            circles[j + 1] = circle
+            lefts[j + 1] = left
+            rights[j + 1] = right
+        self.lefts = lefts
+        self.rights = rights
+
+    def iterate_pairs(self):
+        # Creates a generator that iterates over each pair of circles whose
+        # bounding boxes overlap. Each pair is only found once by the sweep,
+        # so there are never any duplicates.
+        # self.pairCount is the number of pairs yielded by the last call of
+        # this method.
+        self.pairCount = 0
+        circles = self.circles
+        lefts = self.lefts
+        rights = self.rights
+        for a in range(len(circles)):
+            circle1 = circles[a]
+            right = rights[a]
+            for b in range(a + 1, len(circles)):
+                # Every circle from here on is too far to the right.
+                if lefts[b] > right: break
+                circle2 = circles[b]
+                # The bounding boxes overlap on the x axis, so we just
+                # need to check the y axis.
+                if abs(circle1.pos.y - circle2.pos.y) > circle1.radius + circle2.radius: continue
+                self.pairCount += 1
+                yield circle1, circle2
+
+    def iterate_pairs_with(self, positionGridUser):
+        # Iterates over each pair made up of one circle from this SweepAndPrune
+        # and one circle from a PositionGridUser, where the two circles share a
+        # grid space. This works the same way as PositionGridUser.iterate_pairs_with().
+        gridSize = positionGridUser.gridSize
+        for circle1 in self.circles:
+            left1, top1 = circle1.get_grid_range(gridSize)[:2]
+            for gridspace in circle1.find_overlapping_grid_spaces(gridSize):
+                if not gridspace in positionGridUser.positionGrid: continue
+                for circle2 in positionGridUser.positionGrid[gridspace]:
+                    left2, top2 = positionGridUser.gridRanges[circle2][:2]
+                    if gridspace != get_grid_key(max(left1, left2), max(top1, top2)): continue
+                    yield circle1, circle2
+
+    def get_in_radius(self, pos, radius):
+        # Gets a list of circles whose centres are within the given distance
+        # of a position. Circles added since the last call of
+        # self.move_all_circles() aren't in the right place in self.circles
+        # yet, so we just check every circle, skipping any that have been
+        # removed since then.
+        return [
+            circle for circle in self.circles
+            if circle.pos.distance_squared_to(pos) <= radius ** 2 and
+            not circle in self.removedCircles
+        ]
\ No newline at end of file
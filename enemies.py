@@ -246,7 +246,7 @@ class Bat(Entity):
             )
         )
 
-class Python(Entity):
+class Python(ImpulseEntity):
     def __init__(self, app, pos):
         super().__init__(
             app,
@@ -383,7 +383,7 @@ class MineZombie(Entity):
             )
         )
 
-class Viper(Entity):
+class Viper(ImpulseEntity):
     def __init__(self, app, pos):
         super().__init__(
             app,
@@ -849,7 +849,7 @@ class Yeti(Entity):
             )
         )
 
-class Horseman(Entity):
+class Horseman(ImpulseEntity):
     def __init__(self, app, pos):
         super().__init__(
             app,
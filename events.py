@@ -9,9 +9,13 @@ class EventHandler:
         self.mousePos = pygame.math.Vector2()
         self.handle_events()
     
-    def handle_events(self):
-        self.keysJustPressed = []
-        self.mouseJustPressed = []
+    def handle_events(self, clearJustPressed = True):
+        # If clearJustPressed is False, the keys and mouse buttons that were
+        # just pressed are kept until self.clear_just_pressed() is called.
+        # This is used when the game isn't updated exactly once per frame,
+        # so that a key press is only seen by one update, but isn't lost if
+        # there are no updates on the frame it happens.
+        if clearJustPressed: self.clear_just_pressed()
 
         # Iterates over all of the events that happened since the last call
         # to pygame.event.get() and picks out and processes any relevant ones.
@@ -32,6 +36,11 @@ class EventHandler:
         
         self.mousePos.update(pygame.mouse.get_pos())
 
+    def clear_just_pressed(self):
+        # Forgets which keys and mouse buttons have just been pressed.
+        self.keysJustPressed = []
+        self.mouseJustPressed = []
+
     def get_key_just_pressed(self, key):
         # Return if a key has just been pressed.
         return key in self.keysJustPressed
@@ -4,6 +4,14 @@ from animation import *
 
 class Item(VerletObject):
     # Can be found in the level or stored in the player's inventory and used by the player.
+    # Items don't react to collisions themselves - the player and the EquippedObject
+    # pick them up.
+    collisionLayer = ITEMLAYER
+    collisionMask = 0
+    # Items lying on the floor don't do anything until something
+    # touches them, so they can fall asleep.
+    allowSleep = True
+
     def __init__(self, app, pos, name, cost, attackDamage, consumeHp, animation, durability, removesStatusEffects=[]):
         # Items use an empty state machine and a simple animation manager with only one animation.
         super().__init__(
@@ -0,0 +1,82 @@
+import heapq
+
+class KDTree:
+    # Stores items with 2D positions so that the items nearest to a
+    # position can be found quickly, without looking at every item.
+    # The tree is built once and can't be changed afterwards, so it
+    # should only be used for things that never move, like boundaries.
+    # Each node splits the items below it in half, by x position on
+    # even depths and y position on odd depths. When searching, we can
+    # skip any half that is further away than the best items found so far.
+    def __init__(self, items, positions):
+        # items is a list of items to store, and positions is a list
+        # of their positions as (x, y) pairs.
+        entries = [(tuple(pos), item) for pos, item in zip(positions, items)]
+        self.size = len(entries)
+        self.root = self.build(entries, 0)
+
+    def build(self, entries, depth):
+        # Recursively builds the tree from a list of (position, item) pairs,
+        # returning its root KDTreeNode.
+        if not entries: return None
+        axis = depth % 2
+        entries.sort(key = lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        pos, item = entries[middle]
+        return KDTreeNode(
+            pos,
+            item,
+            axis,
+            self.build(entries[:middle], depth + 1),
+            self.build(entries[middle + 1:], depth + 1)
+        )
+
+    def get_nearest(self, pos):
+        # Returns the item nearest to the given position, or None if
+        # the tree is empty.
+        nearest = self.get_k_nearest(pos, 1)
+        if not nearest: return None
+        return nearest[0]
+
+    def get_k_nearest(self, pos, k):
+        # Returns a list of the k items nearest to the given position,
+        # nearest first.
+        # best is a heap of (-squared distance, counter, item) tuples. Python's
+        # heapq always pops the smallest value, so storing negative distances
+        # means we pop the furthest of the best items when we find a nearer one.
+        # The counter stops items from being compared when distances are equal.
+        best = []
+        if k > 0: self.search(self.root, (pos[0], pos[1]), k, best)
+        return [item for _, _, item in sorted(best, reverse = True)]
+
+    def search(self, node, pos, k, best):
+        # Recursively searches a node and its children for items nearer
+        # to pos than the ones in best.
+        if node is None: return
+        distanceSquared = (node.pos[0] - pos[0]) ** 2 + (node.pos[1] - pos[1]) ** 2
+        if len(best) < k:
+            heapq.heappush(best, (-distanceSquared, id(node), node.item))
+        elif distanceSquared < -best[0][0]:
+            heapq.heapreplace(best, (-distanceSquared, id(node), node.item))
+        # We search the half pos is in first, because the nearest items
+        # are most likely to be there.
+        offset = pos[node.axis] - node.pos[node.axis]
+        if offset < 0: near, far = node.left, node.right
+        else: near, far = node.right, node.left
+        self.search(near, pos, k, best)
+        # Items in the other half are at least abs(offset) away, so we only
+        # need to search it if that is nearer than the furthest best item.
+        if len(best) < k or offset * offset < -best[0][0]:
+            self.search(far, pos, k, best)
+
+class KDTreeNode:
+    # Used by KDTree.
+    def __init__(self, pos, item, axis, left, right):
+        self.pos = pos
+        self.item = item
+        # The axis (0 for x, 1 for y) this node splits its children by.
+        # Items in self.left have a smaller value on this axis than
+        # this node, and items in self.right have a larger or equal one.
+        self.axis = axis
+        self.left = left
+        self.right = right
@@ -16,7 +16,14 @@ class LevelContainer:
         self.objectHandler = objectHandler
 
     def update(self):
+        # Enemies following the player all use the same flow field
+        # (see AStarPathfinder.update_flow_field()), which is updated
+        # here before any of them move.
+        self.app.aStarPathfinder.update_flow_field(self.app.player)
         self.objectHandler.update()
+        # Then any paths the enemies requested while they were being
+        # updated are found, within the pathfinding time budget.
+        self.app.aStarPathfinder.update()
 
     def draw(self):
         # The order we draw these in is important.
@@ -161,8 +168,11 @@ class LevelGenerator:
         # We also create a BoundaryHandler and add all of the Boundaries from the
         # list we made to it.
         boundaryHandler = BoundaryHandler(self.app, self.fillArguments)
-        for boundary in totalBoundaries:
-            boundaryHandler.add_boundary(boundary)
+        boundaryHandler.add_boundaries(totalBoundaries)
+        # Now that the level's shape is finished, we can build the things that
+        # depend on all of the boundaries, like the distance field used to
+        # quickly check whether positions are inside the level.
+        boundaryHandler.finalize()
         
         # Then we add an Exit and a RunExit, to allow the player to proceed to the next
         # level or to end the current run.
@@ -190,6 +200,10 @@ class LevelGenerator:
                 0
             ).rotate(random.uniform(0, 360))
         ))
+        # All of the objects that never move have now been added to the level,
+        # so we can build the ObjectHandler's collision grid for them. This
+        # only needs to be done once for the whole level.
+        objectHandler.build_static_grid()
         
         # Next we are going to decorate the level with SimpleObjects.
         # To do this we need to find the bounding box of the level, to
@@ -199,6 +213,9 @@ class LevelGenerator:
         # We use the decoration density argument and the area of the
         # bounding box to calculate how many SimpleObjects to create.
         counter = boundingBox.width * boundingBox.height * 0.0001 * self.decorationDensity
+        # The radius of each SimpleObject. This is also used to check
+        # that there is enough room for a decoration at a position.
+        decorationRadius = 8
         while counter > 0:
             # First we generate a random position inside the bounding
             # box.
@@ -220,15 +237,18 @@ class LevelGenerator:
             obj = SimpleObject(
                 self.app,
                 pos,
-                8,
+                decorationRadius,
                 "decor.png",
                 random.choice(self.decorationObjects)
             )
 
-            # If this object isn't inside the boundaries of the level,
-            # we don't add it to the level.
-            obj.find_overlapping_grid_spaces()
-            if not boundaryHandler.circle_inside_boundaries(obj): continue
+            # If this object isn't far enough inside the boundaries of the
+            # level, we don't add it to the level. This uses the level's
+            # distance field, so it is much quicker than checking each
+            # boundary. The object is created before this check, so that the
+            # same random numbers are used as before and levels generated from
+            # the same seed look the same.
+            if not boundaryHandler.get_walkable(pos, decorationRadius): continue
             
             # Finally we add the SimpleObject to the level.
             objectHandler.add_object(obj)
@@ -36,6 +36,14 @@ class App:
         self.aStarPathfinder = AStarPathfinder(self)
         self.clock = pygame.time.Clock()
         self.update_time()
+        # The game is updated TICKRATE times per second, no matter how
+        # often frames are drawn. self.accumulator is the time in seconds
+        # that has passed but hasn't been updated for yet. Objects are drawn
+        # between where they were on the last two updates, and
+        # self.interpolation is how far between them they should be
+        # drawn, from 0 to 1.
+        self.accumulator = 0
+        self.interpolation = 1
         self.jsonDataManager = JSONDataManager(self)
         self.spritesheetManager = SpritesheetManager(self)
         self.perlinNoise = PerlinNoise(self)
@@ -58,7 +66,26 @@ class App:
         self.running = True
         while self.running:
             self.update_time()
-            self.update()
+            self.eventHandler.handle_events(clearJustPressed = False)
+            # We update the game once for every 1 / TICKRATE seconds that
+            # have passed. If it is running slowly, this can be more than
+            # once per frame, and if frames are being drawn more often than
+            # TICKRATE, some frames won't have any updates.
+            self.accumulator += self.dt / 1000
+            ticks = 0
+            while self.accumulator >= 1 / TICKRATE and self.running:
+                # If we are too far behind, we give up on catching up,
+                # otherwise each frame would take even longer than the last.
+                if ticks == MAXTICKSPERFRAME:
+                    self.accumulator %= 1 / TICKRATE
+                    break
+                self.update()
+                # Keys that were just pressed should only be seen by
+                # one update.
+                self.eventHandler.clear_just_pressed()
+                self.accumulator -= 1 / TICKRATE
+                ticks += 1
+            self.interpolation = min(1, self.accumulator * TICKRATE)
             self.draw()
         self.quit()
 
@@ -86,7 +113,6 @@ class App:
 
     def update(self):
         # All of the game's logic happens here.
-        self.eventHandler.handle_events()
         match self.gameState:
             case 0: # title screen
                 self.titleScreen.update()
@@ -109,6 +135,7 @@ class App:
             case 0: # title screen
                 self.titleScreen.draw()
             case 1: # gameplay
+                self.camera.update_draw_pos()
                 self.levelContainer.draw()
                 self.vignette.draw()
                 self.simpleUI.draw()
@@ -151,6 +178,7 @@ class App:
         # The camera's position will still be somewhere else in the
         # level. We need to snap it back to the player's position.
         self.camera.pos.update(self.player.pos)
+        self.camera.previousPos.update(self.camera.pos)
         
 
     def set_game_state(self, state):
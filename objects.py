@@ -1,4 +1,7 @@
 import random
+import bisect
+import heapq
+import numpy as np
 
 from util import *
 from circles import *
@@ -6,19 +9,187 @@ from states import *
 from animation import *
 from particles import *
 
-class ObjectHandler(PositionGridUser):
+class ObjectList(list):
+    # A list of objects that objects can be removed from quickly.
+    # The index of each object is stored in self.indices, so we don't
+    # need to search through the list to find an object. When an object
+    # is removed, the last object in the list is moved into its place,
+    # so the order of the objects isn't kept.
+    # Objects should only be added and removed with add() and discard(),
+    # otherwise self.indices will be wrong.
+    def __init__(self):
+        super().__init__()
+        self.indices = {}
+
+    def add(self, obj):
+        # Adds an object to the end of the list.
+        if obj in self.indices: return
+        self.indices[obj] = len(self)
+        self.append(obj)
+
+    def discard(self, obj):
+        # Removes an object from the list if it is in it.
+        if not obj in self.indices: return
+        index = self.indices.pop(obj)
+        last = self.pop()
+        if last is not obj:
+            self[index] = last
+            self.indices[last] = index
+
+    def __contains__(self, obj):
+        return obj in self.indices
+
+class ObjectHandler:
     # Handles objects and their collisions.
-    def __init__(self, app):
-        super().__init__(app)
-        self.objects = []
+    def __init__(self, app, broadPhase = BROADPHASE, simulationRadius = SIMULATIONRADIUS):
+        self.app = app
+        # The lists of objects are ObjectLists (see above), so objects
+        # can be removed without searching for them.
+        self.objects = ObjectList()
+        # Different kinds of objects need different things doing to them each
+        # frame, so as well as self.objects, objects are stored in these lists
+        # depending on what kind of object they are. This means we never have
+        # to search through every object to find the ones we need.
+        # Objects (including VerletObjects) need to be updated and drawn.
+        self.updatableObjects = ObjectList()
+        # Particles that are still in the air need to be updated and drawn.
+        self.particles = ObjectList()
+        # Decorations (SimpleObjects) and particles that have landed on the
+        # ground never move, so they only need to be drawn. This list is kept
+        # sorted by y position, so it doesn't need to be sorted every frame.
+        self.decorations = []
+        # Removing an object from the middle of self.decorations would mean
+        # moving every object after it, so removed decorations are only added
+        # to this set, and are skipped when drawing. They are taken out of
+        # self.decorations all at once (see self.remove_decoration()).
+        self.removedDecorations = set()
+        # Collidable objects are split into two groups. Objects that can never
+        # move, like rocks, torches, chests and exits, go in self.staticGrid (see
+        # the PositionGridUser class). This grid is built once, when the level has
+        # been generated, by self.build_static_grid().
+        # VerletObjects are affected by physics so they can move around. They go
+        # in self.dynamicIndex, which is kept up to date every frame.
+        # Keeping them apart means that every frame we only need to do work
+        # for the objects that can actually move, and we never check for
+        # collisions between two objects that can't move.
+        # Both grids use GRIDSIZE, which suits the size of objects.
+        self.staticGrid = PositionGridUser(app, GRIDSIZE)
+        # The broadPhase argument chooses how self.dynamicIndex finds nearby
+        # moving objects. "grid" uses a PositionGridUser and "sweep" uses a
+        # SweepAndPrune. Both find the same collisions, so this lets us compare
+        # how fast they are in real levels.
+        match broadPhase:
+            case "grid":
+                self.dynamicIndex = PositionGridUser(app, GRIDSIZE)
+            case "sweep":
+                self.dynamicIndex = SweepAndPrune(app)
+            case _:
+                raise ValueError(f"Unknown broad phase {broadPhase!r}")
+        # These are lists of the objects that go in self.staticGrid and
+        # self.dynamicIndex.
+        self.staticObjects = ObjectList()
+        self.dynamicObjects = ObjectList()
+        # The positions and radii of the static objects are stored together
+        # in a NumPy array (see self.find_collisions()). Static objects don't
+        # move, so this array only needs to be rebuilt when a static object is
+        # added or removed, which is when self.staticDataChanged is set.
+        self.staticData = np.zeros((0, 3))
+        self.staticDataChanged = True
+        # Static objects added before self.build_static_grid() is called are
+        # only stored in self.staticObjects until the grid is built.
+        self.staticGridBuilt = False
+        # Objects can be added or removed while we are iterating over the
+        # objects or the pairs in the position grids (for example, when an
+        # enemy dies, an item is picked up or a chest spills out its contents).
+        # Changing the lists and grids during that iteration isn't safe, so
+        # while self.deferChanges is True, adding and removing objects is
+        # stored in self.pendingChanges, and applied at the end of updating
+        # objects and handling collisions (see self.apply_pending_changes()).
+        # Objects waiting to be removed are also stored in self.pendingRemovals,
+        # so they can be skipped for the rest of the frame.
+        self.deferChanges = False
+        self.pendingChanges = []
+        self.pendingRemovals = set()
+        # The number of pairs of objects that were checked for collisions on
+        # the last frame, and the number of those pairs that were found to be
+        # colliding. These show how well the position grids are cutting down
+        # on collision checks.
+        self.pairCount = 0
+        self.collisionCount = 0
+        # This dictionary stores which objects' collide() methods should be
+        # called when two objects collide. Its keys are pairs of classes, and
+        # its values are pairs of Booleans. It is filled in as new pairs of
+        # classes collide (see self.get_collision_dispatch()).
+        self.collisionDispatchTable = {}
+        # This set stores every pair of objects that are touching, as
+        # contacts. A contact is a tuple of two objects. Contacts are kept
+        # from frame to frame, which lets us tell when two objects start or
+        # stop touching (see self.handle_collisions()).
+        self.contacts = set()
+        # This dictionary stores the set of objects that each object is
+        # touching, so they can be found without searching self.contacts.
+        self.objectContacts = {}
+        # Objects that are far away from the player can't be seen or heard
+        # and don't affect the player, so only objects within
+        # self.simulationRadius of the player are updated. If it is None,
+        # every object is updated.
+        self.simulationRadius = simulationRadius
+        # This set stores the VerletObjects that were updated on this frame
+        # (see self.update()). Only these objects can move into other objects.
+        self.movingObjects = set()
+        # The number of frames this ObjectHandler has been updated for.
+        # This is used to work out which objects should be updated on
+        # each frame (see self.get_tick_interval()).
+        self.frame = 0
 
     def update(self):
-        # Calls the update method of all objects in self.objects
-        # that aren't SimpleObjects. There will be lots of SimpleObjects
-        # in the level (used for decoration) so not calling their update
-        # methods improves performance.
-        for obj in [i for i in self.objects if not isinstance(i, SimpleObject)]:
+        # Calls the update method of all objects in self.updatableObjects
+        # and self.particles. There will be lots of SimpleObjects in the
+        # level (used for decoration) so not calling their update methods
+        # improves performance.
+        # Objects can be added or removed while they are being updated (for
+        # example, when an enemy dies). These changes are saved until all of
+        # the objects have been updated (see self.add_object()).
+        self.deferChanges = True
+        self.frame += 1
+        self.movingObjects = set()
+        activeObjects = self.get_active_objects()
+        for obj in self.updatableObjects:
+            # Objects that have been removed earlier on this frame
+            # aren't in the level any more so shouldn't be updated.
+            if self.pendingRemovals and obj in self.pendingRemovals: continue
+            # Objects outside the simulation radius are frozen until the
+            # player comes close enough to them. No time passes for frozen
+            # objects, so they don't need to catch up when they are updated.
+            if activeObjects is not None and not obj in activeObjects:
+                obj.lastTickFrame = self.frame
+                continue
+            # Objects that are only updated every few frames are skipped
+            # on the frames in between. When they are updated, they are
+            # told how many frames have passed since they were last updated.
+            if obj.farTickInterval > 1:
+                if (self.frame + obj.tickPhase) % self.get_tick_interval(obj): continue
+                obj.tickFrames = min(self.frame - obj.lastTickFrame, obj.farTickInterval)
+                obj.lastTickFrame = self.frame
+            if isinstance(obj, VerletObject):
+                # Sleeping objects aren't moving, so we don't update them
+                # either unless the player has come close enough to wake them.
+                if obj.sleeping:
+                    if not obj.get_should_wake(): continue
+                    obj.wake()
+                self.movingObjects.add(obj)
             obj.update()
+        # Once a particle has landed on the ground, it won't move again,
+        # so it is moved into self.decorations. We iterate over a copy of
+        # self.particles because particles are removed from it here.
+        for particle in list(self.particles):
+            if particle.z <= 0:
+                particle.update()
+                self.particles.discard(particle)
+                self.insert_decoration(particle)
+            else:
+                particle.update()
+        self.apply_pending_changes()
         # After this, we process object collisions.
         self.handle_collisions()
 
@@ -27,51 +198,370 @@ class ObjectHandler(PositionGridUser):
         # Objects with a lower y position (higher on screen)
         # will be drawn first, so objects appear in the correct
         # order.
-        for obj in sorted(self.objects, key = lambda x: x.pos.y):
+        # self.decorations is already sorted, so we only need to sort the
+        # objects that can move, then merge the two sorted lists together.
+        decorations = self.decorations
+        if self.removedDecorations:
+            decorations = (obj for obj in decorations if not obj in self.removedDecorations)
+        for obj in heapq.merge(
+            sorted(self.updatableObjects + self.particles, key = self.get_draw_order),
+            decorations,
+            key = self.get_draw_order
+        ):
             obj.draw()
 
+    def get_active_objects(self):
+        # Returns a set of the objects within self.simulationRadius of the
+        # player, or None if every object should be updated. Every object
+        # that can be updated is in self.staticGrid or self.dynamicIndex, so
+        # we can use these to find them.
+        if self.simulationRadius is None: return None
+        return set(
+            self.dynamicIndex.get_in_radius(self.app.player.pos, self.simulationRadius) +
+            self.staticGrid.get_in_radius(self.app.player.pos, self.simulationRadius)
+        )
+
+    def get_tick_interval(self, obj):
+        # Returns how often an object should be updated, in frames. Objects
+        # on screen are updated on every frame. Objects off screen are
+        # updated less often the further away from the player they are.
+        if self.app.camera.get_on_screen(obj): return 1
+        if obj.pos.distance_squared_to(self.app.player.pos) <= LODDISTANCE ** 2:
+            return obj.nearTickInterval
+        return obj.farTickInterval
+
+    def get_draw_order(self, obj):
+        # Returns the value objects are sorted by when they are drawn.
+        return obj.pos.y
+
     def add_object(self, obj):
-        # Adds an object to this ObjectHandler.
-        self.objects.append(obj)
+        # Adds an object to this ObjectHandler. If we are in the middle
+        # of updating objects or handling collisions, this is saved until
+        # we have finished.
+        if self.deferChanges:
+            self.pendingChanges.append((self.insert_object, obj))
+            self.pendingRemovals.discard(obj)
+        else:
+            self.insert_object(obj)
 
     def remove_object(self, obj):
-        # Removes an object from this ObjectHandler.
-        if obj in self.objects:
-            self.objects.remove(obj)
+        # Removes an object from this ObjectHandler. If we are in the middle
+        # of updating objects or handling collisions, this is saved until
+        # we have finished.
+        if self.deferChanges:
+            self.pendingChanges.append((self.delete_object, obj))
+            self.pendingRemovals.add(obj)
+        else:
+            self.delete_object(obj)
+
+    def apply_pending_changes(self):
+        # Adds and removes the objects that were added and removed while
+        # we were updating objects or handling collisions, in the order
+        # they were added and removed.
+        self.deferChanges = False
+        for method, obj in self.pendingChanges:
+            method(obj)
+        self.pendingChanges = []
+        self.pendingRemovals.clear()
+
+    def insert_object(self, obj):
+        # Adds an object to this ObjectHandler straight away.
+        self.objects.add(obj)
+        if isinstance(obj, SimpleObject):
+            self.insert_decoration(obj)
+        elif isinstance(obj, Particle):
+            self.particles.add(obj)
+        else:
+            self.updatableObjects.add(obj)
+            # Objects that aren't updated on every frame are given different
+            # phases, so they aren't all updated on the same frames.
+            obj.lastTickFrame = self.frame
+            obj.tickPhase = len(self.updatableObjects)
+        # Objects that can collide are also inserted into one of the position
+        # grids straight away. From then on, moving objects are only moved between
+        # grid spaces when they cross into new ones (see self.handle_collisions()).
+        # An object that is added might be moving (for example, an item
+        # that has just been dropped), so it shouldn't be asleep.
+        if isinstance(obj, VerletObject):
+            obj.wake()
+            self.movingObjects.add(obj)
+        if self.get_static(obj):
+            self.staticObjects.add(obj)
+            self.staticDataChanged = True
+            if self.staticGridBuilt:
+                self.staticGrid.insert_circle(obj)
+        elif self.get_dynamic(obj):
+            self.dynamicObjects.add(obj)
+            self.dynamicIndex.insert_circle(obj)
+
+    def delete_object(self, obj):
+        # Removes an object from this ObjectHandler straight away.
+        if not obj in self.objects: return
+        self.objects.discard(obj)
+        if isinstance(obj, SimpleObject) or (isinstance(obj, Particle) and not obj in self.particles):
+            self.remove_decoration(obj)
+        else:
+            self.updatableObjects.discard(obj)
+            self.particles.discard(obj)
+        # An object that has been removed isn't touching anything.
+        for other in self.get_contacts(obj):
+            self.remove_contact((obj, other) if id(obj) < id(other) else (other, obj))
+        if obj in self.staticObjects:
+            self.staticObjects.discard(obj)
+            self.staticDataChanged = True
+            if self.staticGridBuilt:
+                self.staticGrid.remove_circle(obj)
+        elif obj in self.dynamicObjects:
+            self.dynamicObjects.discard(obj)
+            self.dynamicIndex.remove_circle(obj)
+
+    def insert_decoration(self, obj):
+        # Adds an object to self.decorations, keeping it sorted by y position.
+        # If the object was removed earlier, its old entry might still be in
+        # the list, so we take the removed objects out first.
+        if obj in self.removedDecorations: self.compact_decorations()
+        bisect.insort(self.decorations, obj, key = self.get_draw_order)
+
+    def remove_decoration(self, obj):
+        # Marks an object in self.decorations as removed. Once at least half
+        # of the list has been removed, we take them all out in one go, so
+        # on average removing an object takes the same time however many
+        # decorations there are.
+        self.removedDecorations.add(obj)
+        if len(self.removedDecorations) * 2 >= len(self.decorations):
+            self.compact_decorations()
+
+    def compact_decorations(self):
+        # Takes the removed objects out of self.decorations.
+        self.decorations = [obj for obj in self.decorations if not obj in self.removedDecorations]
+        self.removedDecorations.clear()
+
+    def get_static(self, obj):
+        # Returns whether an object should be stored in self.staticGrid.
+        # Objects that aren't VerletObjects never move, except for SimpleObjects
+        # and Particles. We don't add these to either grid as this would be bad
+        # for performance - we would be doing unnecessary checks as these classes
+        # are never collidable.
+        return isinstance(obj, Object) and not isinstance(obj, VerletObject)
+
+    def get_dynamic(self, obj):
+        # Returns whether an object should be stored in self.dynamicIndex.
+        return isinstance(obj, VerletObject)
+
+    def build_static_grid(self):
+        # Builds self.staticGrid using every static object that has been added
+        # so far. This is called once the level has been generated.
+        self.staticGrid.update_position_grid(self.staticObjects)
+        # Static objects are randomly placed when the level is generated, so
+        # some of them may be overlapping. We will never check static objects
+        # against each other for collisions after this, so we move any that
+        # are overlapping apart now. A few passes are made because moving one
+        # pair apart can push one of them into another object.
+        for _ in range(3):
+            for a, b in self.staticGrid.iterate_pairs():
+                if not a.collidable or not b.collidable or not a.get_colliding(b): continue
+                self.collision_response(a, b, 1)
+        # The objects we have just moved might be in different grid spaces now.
+        self.staticGrid.update_position_grid(self.staticObjects)
+        self.staticGridBuilt = True
+        self.staticDataChanged = True
 
     def handle_collisions(self):
         # In this method, we check which objects are overlapping with each other and
         # process collision responses between those that do.
-        # First we update self.positionGrid, which lets us easily see which objects
+        # First we update self.dynamicIndex, which lets us easily see which objects
         # are close to each other so should have a collision check performed between
-        # them. We don't add SimpleObjects or Particles to this grid as this would
-        # we bad for performance - we would be doing unnecessary checks as these classes
-        # are never collidable.
-        self.update_position_grid([i for i in self.objects if not isinstance(i, (SimpleObject, Particle))])
-        # Then we iterate over each pair of nearby objects.
-        for a, b in self.iterate_pairs():
+        # them. Objects are inserted into it when they are added to this ObjectHandler,
+        # so here we only need to account for how they have moved since the last frame.
+        self.dynamicIndex.move_all_circles()
+        # Then we find which pairs of nearby objects are actually overlapping.
+        self.deferChanges = True
+        self.collisionCount = 0
+        # This set stores the contacts (see self.contacts) that are still
+        # touching on this frame.
+        touching = set()
+        for a, b, overlapVector in self.find_collisions():
+            # If one of the objects was removed by an earlier collision on this
+            # frame (for example, an item that was picked up), it isn't in
+            # the level any more so shouldn't collide with anything.
+            if self.pendingRemovals and (a in self.pendingRemovals or b in self.pendingRemovals):
+                continue
             # If either of the objects isn't collidable, continue
             # to the next pair because a collision response
-            # shouldn't occur.
+            # shouldn't occur. We check this here rather than in
+            # self.find_collisions() because an object can stop being
+            # collidable during an earlier collision on the same frame
+            # (for example, when a chest is opened).
             if not a.collidable or not b.collidable:
                 continue
-            # Now we actually check if the objects are overlapping.
-            # If they aren't, continue to the next pair.
-            if not a.get_colliding(b): continue
-            # By this point we know that the objects are colliding
-            # with each other, so we should call their collide()
-            # methods.
-            a.collide(b)
-            b.collide(a)
+            # Contacts are stored with the objects in the same order every
+            # frame, no matter which order the position grids gave them in.
+            contact = (a, b) if id(a) < id(b) else (b, a)
+            # We only need to do anything if at least one of the objects
+            # moved on this frame. Sleeping objects, objects outside the
+            # simulation radius and static objects can't have moved into
+            # each other.
+            if not (a in self.movingObjects or b in self.movingObjects):
+                # The objects haven't moved, so if they were touching
+                # before, they still are.
+                if contact in self.contacts: touching.add(contact)
+                continue
+            # Otherwise, a sleeping object is woken up so it can be pushed away.
+            if a.sleeping: a.wake()
+            if b.sleeping: b.wake()
+            self.collisionCount += 1
+            touching.add(contact)
+            # By this point we know that the objects are colliding with each
+            # other, so we should call their collision methods. If they weren't
+            # touching on the last frame, this is the start of a new contact.
+            # Most pairs of objects can't interact with each other (for example,
+            # two enemies), so we only call these methods on objects that
+            # want to know about collisions with the other object.
+            (
+                aBegin, bBegin, aCollide, bCollide, _, _
+            ) = self.get_collision_dispatch(a, b)
+            if not contact in self.contacts:
+                self.add_contact(contact)
+                if aBegin: a.collide_begin(b)
+                if bBegin: b.collide_begin(a)
+            if aCollide: a.collide(b)
+            if bCollide: b.collide(a)
             # This check is made to ensure that we don't try to perform
             # collision checks when we have just progressed to the next
             # level. If we do, it can lead to unwanted behaviour.
-            if self.app.levelContainer.objectHandler != self: return
+            if self.app.levelContainer.objectHandler != self: break
             # Finally we attempt to move the two objects apart.
-            self.collision_response(a, b)
+            self.collision_response(a, b, overlapVector = overlapVector)
+        else:
+            # If we didn't break out of the loop, any contacts that weren't
+            # touching on this frame have ended. We don't need to tell objects
+            # that have been removed on this frame.
+            for contact in self.contacts - touching:
+                a, b = contact
+                if self.pendingRemovals and (a in self.pendingRemovals or b in self.pendingRemovals):
+                    continue
+                self.remove_contact(contact)
+                _, _, _, _, aEnd, bEnd = self.get_collision_dispatch(a, b)
+                if aEnd: a.collide_end(b)
+                if bEnd: b.collide_end(a)
+                if self.app.levelContainer.objectHandler != self: break
+        # Now that we have finished iterating over the position grids, it is
+        # safe to add and remove the objects that were added and removed
+        # during the collisions.
+        self.apply_pending_changes()
+
+    def get_collision_dispatch(self, a, b):
+        # Returns six Booleans, saying whether a.collide_begin(b),
+        # b.collide_begin(a), a.collide(b), b.collide(a), a.collide_end(b)
+        # and b.collide_end(a) should be called when a and b collide. This
+        # only depends on the classes of a and b, so we work it out once for
+        # each pair of classes and store it in self.collisionDispatchTable.
+        key = (type(a), type(b))
+        if not key in self.collisionDispatchTable:
+            self.collisionDispatchTable[key] = (
+                bool(a.collisionBeginMask & b.collisionLayer),
+                bool(b.collisionBeginMask & a.collisionLayer),
+                bool(a.collisionMask & b.collisionLayer),
+                bool(b.collisionMask & a.collisionLayer),
+                bool(a.collisionEndMask & b.collisionLayer),
+                bool(b.collisionEndMask & a.collisionLayer)
+            )
+        return self.collisionDispatchTable[key]
+
+    def add_contact(self, contact):
+        # Stores a new contact between two objects.
+        a, b = contact
+        self.contacts.add(contact)
+        self.objectContacts.setdefault(a, set()).add(b)
+        self.objectContacts.setdefault(b, set()).add(a)
+
+    def remove_contact(self, contact):
+        # Removes a contact between two objects.
+        a, b = contact
+        self.contacts.discard(contact)
+        for obj, other in ((a, b), (b, a)):
+            if not obj in self.objectContacts: continue
+            self.objectContacts[obj].discard(other)
+            if not self.objectContacts[obj]: del self.objectContacts[obj]
 
-    def collision_response(self, a, b):
+    def get_contacts(self, obj):
+        # Returns a list of the objects that were touching the
+        # given object when collisions were last handled.
+        return list(self.objectContacts.get(obj, ()))
+
+    def find_collisions(self):
+        # Returns a list of (a, b, overlap vector) for every pair of nearby
+        # objects that are overlapping.
+        # The pairs of nearby objects are the pairs of nearby moving objects,
+        # and the pairs made up of a moving object and a nearby static object.
+        # Pairs of static objects are never checked.
+        dynamicPairs = list(self.dynamicIndex.iterate_pairs())
+        staticPairs = list(self.dynamicIndex.iterate_pairs_with(self.staticGrid))
+        pairs = dynamicPairs + staticPairs
+        self.pairCount = len(pairs)
+        if not pairs: return []
+
+        # Checking each pair one at a time in Python is slow when there are lots
+        # of them, so instead we put the positions and radii of the objects into
+        # NumPy arrays and check every pair at once.
+        # Each row of these arrays is (x, y, radius). Each object's collisionIndex
+        # attribute stores which row it is in. The static objects' rows come after
+        # the moving objects' rows.
+        for i, obj in enumerate(self.dynamicObjects):
+            obj.collisionIndex = i
+        dynamicData = np.array(
+            [(obj.pos.x, obj.pos.y, obj.radius) for obj in self.dynamicObjects],
+            dtype = float
+        ).reshape(-1, 3)
+        if self.staticDataChanged:
+            for i, obj in enumerate(self.staticObjects):
+                obj.collisionIndex = i
+            self.staticData = np.array(
+                [(obj.pos.x, obj.pos.y, obj.radius) for obj in self.staticObjects],
+                dtype = float
+            ).reshape(-1, 3)
+            self.staticDataChanged = False
+        data = np.concatenate((dynamicData, self.staticData))
+        staticOffset = len(self.dynamicObjects)
+        indices = np.array(
+            [(a.collisionIndex, b.collisionIndex) for a, b in dynamicPairs] +
+            [(a.collisionIndex, b.collisionIndex + staticOffset) for a, b in staticPairs],
+            dtype = np.intp
+        )
+
+        # Now we work out which pairs are overlapping, the same way as
+        # Circle.get_colliding().
+        a = data[indices[:, 0]]
+        b = data[indices[:, 1]]
+        displacement = b[:, :2] - a[:, :2]
+        distance = np.sqrt((displacement ** 2).sum(axis = 1))
+        radiusSum = a[:, 2] + b[:, 2]
+        colliding = np.flatnonzero(distance < radiusSum)
+        if not len(colliding): return []
+
+        # Then we work out the overlap vectors of the overlapping pairs, the same
+        # way as Circle.get_overlap_vector(). direction * radiusSum - displacement
+        # is the same as displacement * (radiusSum / distance - 1). If the two
+        # objects are in exactly the same place, the overlap vector is (0, 0).
+        distance = distance[colliding]
+        scale = np.divide(
+            radiusSum[colliding],
+            distance,
+            out = np.ones_like(distance),
+            where = distance > 0
+        ) - 1
+        overlapVectors = displacement[colliding] * scale[:, None]
+
+        return [
+            (*pairs[index], pygame.math.Vector2(overlapVector))
+            for index, overlapVector in zip(colliding.tolist(), overlapVectors.tolist())
+        ]
+
+    def collision_response(self, a, b, strength = 0.1, overlapVector = None):
         # This method moves two overlapping objects apart.
+        # The strength argument is the fraction of the overlap that
+        # is removed. Only removing some of it each frame makes objects
+        # push each other apart smoothly instead of jumping apart.
         # We decide whether to move an object based on whether
         # it and the object it is colliding with are VerletObjects
         # or not. These variables are used for this.
@@ -81,7 +571,9 @@ class ObjectHandler(PositionGridUser):
         # This is the vector that describes how the
         # two objects are overlapping. It will be used
         # to move them apart by the correct amount.
-        overlapVector = a.get_overlap_vector(b)
+        # It can be passed in if it has already been
+        # calculated.
+        if overlapVector is None: overlapVector = a.get_overlap_vector(b)
 
         # If both objects are VerletObjects, we should
         # move them both because they are both affected
@@ -104,11 +596,36 @@ class ObjectHandler(PositionGridUser):
         elif bVerletObject: ratio = 1
         
         # Finally we make the adjustments to the objects' positions.
-        a.pos += overlapVector * (ratio - 1) * 0.1
-        b.pos += overlapVector * ratio * 0.1
+        a.pos += overlapVector * (ratio - 1) * strength
+        b.pos += overlapVector * ratio * strength
 
 class Object(Circle):
     # An object in the world - has animations and state machines.
+    # Every class of object is on a collision layer (see util.py).
+    # Its collision mask is made up of the layers it wants to know
+    # about collisions with - its collide() method is only called
+    # when it collides with an object on one of these layers.
+    # Plain Objects are used for scenery like rocks, torches and
+    # campfires, which don't react to collisions, so their mask is
+    # empty. They still push other objects away.
+    # The begin and end masks work the same way for collide_begin(),
+    # which is called when two objects start touching, and collide_end(),
+    # which is called when they stop touching. collide() is called on
+    # every frame that they are touching.
+    collisionLayer = OBJECTLAYER
+    collisionMask = 0
+    collisionBeginMask = 0
+    collisionEndMask = 0
+    # Only VerletObjects can fall asleep (see VerletObject).
+    sleeping = False
+    # Objects are updated on every frame, but some objects can be updated
+    # less often when they are off screen, to save time. These are the
+    # numbers of frames between updates when the object is off screen and
+    # within LODDISTANCE of the player, and when it is further away
+    # (see ObjectHandler.get_tick_interval()).
+    nearTickInterval = 1
+    farTickInterval = 1
+
     def __init__(
             self, 
             app, 
@@ -145,12 +662,20 @@ class Object(Circle):
         for key, value in states.items():
             self.stateMachines[key] = StateMachine(self.app, self, value)
 
+        # The number of frames that have passed since this object was last
+        # updated. This is 1 unless the object isn't being updated on every
+        # frame (see nearTickInterval and farTickInterval above).
+        self.tickFrames = 1
+        # These are set by the ObjectHandler this object is added to.
+        self.lastTickFrame = 0
+        self.tickPhase = 0
+
     def update(self):
         # First we update all of the state machines in
         # self.stateMachines, and self.animationManager.
         for stateMachine in self.stateMachines:
             self.stateMachines[stateMachine].update()
-        self.animationManager.update()
+        self.animationManager.update(self.tickFrames)
 
         # Then, if this object has a sound defined:
         if self.sound != None:
@@ -173,7 +698,7 @@ class Object(Circle):
         sprite = self.tint_surface(sprite, self.tint)
         self.app.camera.blit(
             sprite,
-            self.pos - (
+            self.get_draw_pos() - (
                 self.animationManager.spritesheet.spriteWidth * 0.5,
                 max(
                     self.animationManager.spritesheet.spriteHeight * 0.8,
@@ -182,6 +707,12 @@ class Object(Circle):
             )
         )
 
+    def get_draw_pos(self):
+        # Returns the position this object should be drawn at.
+        # Objects that can move are drawn between their positions
+        # on the last two updates (see App.run()).
+        return self.pos
+
     def get_camera_target_pos(self):
         # Provides a position for the camera to target
         # if the camera's target object is this object.
@@ -194,6 +725,18 @@ class Object(Circle):
         # in self.stateMachines.
         for stateMachine in self.stateMachines:
             self.stateMachines[stateMachine].collide(obj)
+
+    def collide_begin(self, obj):
+        # This method is called when this object starts
+        # colliding with another object.
+        for stateMachine in self.stateMachines:
+            self.stateMachines[stateMachine].collide_begin(obj)
+
+    def collide_end(self, obj):
+        # This method is called when this object stops
+        # colliding with another object.
+        for stateMachine in self.stateMachines:
+            self.stateMachines[stateMachine].collide_end(obj)
     
     def tint_surface(self, surface, colour):
         # This method tints this object's sprite a certain
@@ -254,6 +797,14 @@ class SimpleObject(Circle):
 
 class VerletObject(Object):
     # An object that uses the Verlet integration physics system.
+    # If allowSleep is True, the object falls asleep when it has been
+    # almost still for a while. Sleeping objects are skipped by
+    # ObjectHandler.update() until they are woken up by a collision,
+    # by being accelerated or by the player coming close. Only objects
+    # that don't do anything by themselves, like items lying on the
+    # floor, should be allowed to sleep.
+    allowSleep = False
+
     def __init__(
             self,
             app,
@@ -281,7 +832,27 @@ class VerletObject(Object):
         # back inside the closest one it was previously nearby.
         self.previousNearbyBoundaries = []
 
+        self.sleeping = False
+        # The number of frames in a row this object's speed has
+        # been below SLEEPVELOCITY.
+        self.sleepTimer = 0
+
     def update(self):
+        # First we move the object.
+        self.integrate()
+        super().update()
+        # Then we snap the object back inside the boundaries of the level.
+        self.app.levelContainer.boundaryHandler.snap_inside_boundaries(self)
+        # If this object can fall asleep, we check whether it has stopped moving.
+        if self.allowSleep: self.update_sleep()
+
+    def integrate(self):
+        # Moves the object using its velocity and acceleration.
+        # If more than one frame has passed since this object was last
+        # updated, we move it as if it had been updated on each of them.
+        if self.tickFrames > 1:
+            self.integrate_over_frames(self.tickFrames)
+            return
         # First, we calcualate the object's velocity.
         # This is the vector between the position on the last frame
         # and the current position. We also add on the object's
@@ -299,13 +870,70 @@ class VerletObject(Object):
         self.previousPos.update(self.pos)
         # Then we apply the object's velocity.
         self.pos += self.velocity
-        super().update()
-        # Finally we snap the object back inside the boundaries of the level.
-        self.app.levelContainer.boundaryHandler.snap_inside_boundaries(self)
+
+    def integrate_over_frames(self, frames):
+        # Does the same as self.integrate(), but for several frames at once.
+        # The acceleration is treated as if it was applied on every one of
+        # these frames, which is what happens when an entity moves towards
+        # something.
+        # Each frame, the velocity has the acceleration added to it and is
+        # then multiplied by the friction, so after n frames the velocity is
+        #     v(n) = v(0) * f^n + a * S(n)
+        # where f is the friction, a is the acceleration multiplied by the
+        # traction, and S(n) = f + f^2 + ... + f^n. The object moves by
+        # the sum of v(1) to v(n), which we can also work out directly.
+        friction = self.app.levelGenerator.friction
+        acceleration = self.acceleration * self.app.levelGenerator.traction
+        velocity = self.pos - self.previousPos
+        if friction == 1:
+            total = frames
+            totalOfTotals = frames * (frames + 1) / 2
+        else:
+            total = friction * (1 - friction ** frames) / (1 - friction)
+            totalOfTotals = friction / (1 - friction) * (frames - total)
+        displacement = velocity * total + acceleration * totalOfTotals
+        self.velocity = velocity * friction ** frames + acceleration * total
+        self.acceleration.update()
+        self.pos += displacement
+        # self.previousPos is the position one frame ago, so that the
+        # velocity is correct on the next update.
+        self.previousPos.update(self.pos - self.velocity)
+
+    def update_sleep(self):
+        # Puts this object to sleep if it has been moving slower than
+        # SLEEPVELOCITY for SLEEPFRAMES frames.
+        if self.velocity.magnitude_squared() < SLEEPVELOCITY ** 2:
+            self.sleepTimer += 1
+        else:
+            self.sleepTimer = 0
+        if self.sleepTimer >= SLEEPFRAMES:
+            self.sleeping = True
+            # The object is almost still, so we stop it completely. This
+            # means it won't suddenly move when it is woken up.
+            self.velocity.update()
+            self.previousPos.update(self.pos)
+
+    def wake(self):
+        # Wakes this object up so it is updated again.
+        self.sleeping = False
+        self.sleepTimer = 0
+
+    def get_should_wake(self):
+        # Returns whether the player is close enough to this
+        # sleeping object to wake it up.
+        return self.app.player.pos.distance_squared_to(self.pos) < SLEEPWAKEDISTANCE ** 2
+
+    def get_draw_pos(self):
+        # self.previousPos is where this object was on the last update,
+        # so we draw it between there and where it is now.
+        return self.previousPos.lerp(self.pos, self.app.interpolation)
 
     def accelerate(self, by):
-        # Acclerates the object by the given vector.
+        # Acclerates the object by the given vector. An object
+        # that is being accelerated is about to move, so it
+        # shouldn't be asleep.
         self.acceleration += by
+        self.wake()
 
     def get_within_boundaries(self, nearbyBoundaries):
         # This method returns whether this object is inside
@@ -328,6 +956,21 @@ class VerletObject(Object):
         # on the half of the circumference in the direction the
         # object is moving - the boundaries cannot move into
         # the object from behind.
+        # Then we check if each point is within the boundaries.
+        # If any of the points are outside the boundaries, we
+        # return False. We only return True if all of the points
+        # are inside the boundaries.
+        for point in self.get_boundary_check_points():
+            pointInsideBoundaries = False
+            for boundary in nearbyBoundaries:
+                if (boundary.pos - point).magnitude() < boundary.radius - self.radius:
+                    pointInsideBoundaries = True
+                    break
+            if not pointInsideBoundaries: return False
+        return True
+
+    def get_boundary_check_points(self):
+        # Returns a list of the points used by self.get_within_boundaries().
         if self.velocity.magnitude_squared() == 0:
             vector = pygame.math.Vector2(1, 0)
         else:
@@ -349,23 +992,18 @@ class VerletObject(Object):
         # to get rid of cases where a thin sliver of wall could
         # sneak in between two points.
         vector = vector.rotate(random.uniform(-0.5, 0.5) * angle)
-        # Then we check if each point is within the boundaries.
-        # If any of the points are outside the boundaries, we
-        # return False. We only return True if all of the points
-        # are inside the boundaries.
-        for i in range(pointsToCheck):
-            point = self.pos + vector.rotate(i * angle)
-            pointInsideBoundaries = False
-            for boundary in nearbyBoundaries:
-                if (boundary.pos - point).magnitude() < boundary.radius - self.radius:
-                    pointInsideBoundaries = True
-                    break
-            if not pointInsideBoundaries: return False
-        return True
+        return [self.pos + vector.rotate(i * angle) for i in range(pointsToCheck)]
 
 class Entity(VerletObject):
     # Used for enemies and the player, has common methods and attributes
     # for these use cases.
+    # Enemies only react to collisions with the player (to attack them).
+    collisionLayer = ENEMYLAYER
+    collisionMask = PLAYERLAYER
+    # Enemies off screen are updated less often.
+    nearTickInterval = 4
+    farTickInterval = 16
+
     def __init__(
             self,
             app,
@@ -453,9 +1091,22 @@ class Entity(VerletObject):
             )
         return True
 
+class ImpulseEntity(Entity):
+    # Used for enemies that move using State_Python_Following, which only
+    # accelerates them when their animation changes frame. These sudden
+    # bursts can't be caught up on when the entity is updated less often
+    # (see ObjectHandler.get_tick_interval()), so they are always updated
+    # on every frame.
+    nearTickInterval = 1
+    farTickInterval = 1
+
 class Chest(Object): 
     # Contains items, and spills out these
     # items into the level when opened.
+    # Chests open as soon as the player touches them.
+    collisionLayer = CHESTLAYER
+    collisionBeginMask = PLAYERLAYER
+
     def __init__(self, app, pos, contains):
         # I really don't like this import here, but we
         # have to do it otherwise there will be a circular
@@ -485,6 +1136,9 @@ class Chest(Object):
 class Exit(Object):
     # When the player interacts with this object, we
     # progress to the next level.
+    collisionLayer = EXITLAYER
+    collisionMask = PLAYERLAYER
+
     def __init__(self, app, pos):
         super().__init__(
             app,
@@ -507,6 +1161,9 @@ class Exit(Object):
 class RunExit(Object):
     # When the player interacts with this object, we
     # end the run and transition to the results screen.
+    collisionLayer = EXITLAYER
+    collisionMask = PLAYERLAYER
+
     def __init__(self, app, pos):
         super().__init__(
             app,
@@ -69,8 +69,13 @@ class Particle(Circle):
         self.pos += self.velocity
 
     def draw(self):
-        # Drawing the particle to the screen.
-        pos = self.app.camera.adjust_pos(self.pos) - (0, self.z)
+        # Drawing the particle to the screen. It is drawn between where
+        # it was on the last update and where it is now (see App.run()).
+        remaining = 1 - self.app.interpolation
+        pos = (
+            self.app.camera.adjust_pos(self.pos - self.velocity * remaining) -
+            (0, max(0, self.z - self.zVelocity * remaining))
+        )
         # pygame's circle drawing code can only draw circles with
         # a minimum radius of 2. If we want to draw a circle with
         # a radius of 1, we just have to draw a single pixel manually.
@@ -92,6 +92,10 @@ class Inventory:
 class EquippedObject(VerletObject):
     # This object is displayed in front of the player when an item is equipped. Enemies that collide
     # with this object at a certain angle are damaged if the item has a positive damage value.
+    # It can also pick up items.
+    collisionLayer = EQUIPPEDLAYER
+    collisionMask = ITEMLAYER | ENEMYLAYER
+
     def __init__(self, app, user):
         # This AnimationManager with a single empty animation is used when the player isn't holding
         # anything.
@@ -157,9 +161,21 @@ class EquippedObject(VerletObject):
         self.update_display()
         super().update()
 
+    def get_draw_pos(self):
+        # This object is always drawn in the same place relative to
+        # its user, wherever its user is drawn.
+        return self.user.get_draw_pos() + (self.pos - self.user.pos)
+
 class Player(Entity):
     # The user controls the movement of this class.
     # When its health reaches 0, the run ends.
+    # The player only reacts to collisions with items (to pick them up).
+    collisionLayer = PLAYERLAYER
+    collisionMask = ITEMLAYER
+    # The player is always updated on every frame.
+    nearTickInterval = 1
+    farTickInterval = 1
+
     def __init__(self, app):
         super().__init__(
             app,
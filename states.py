@@ -25,6 +25,14 @@ class StateMachine:
         if not self.active: return
         self.states[self.currentState].collide(obj)
 
+    def collide_begin(self, obj):
+        if not self.active: return
+        self.states[self.currentState].collide_begin(obj)
+
+    def collide_end(self, obj):
+        if not self.active: return
+        self.states[self.currentState].collide_end(obj)
+
     def set_state(self, name):
         # Transitions to the given state.
         if not self.active: return
@@ -49,4 +57,8 @@ class State:
 
     def update(self): ...
 
-    def collide(self, obj): ...
\ No newline at end of file
+    def collide(self, obj): ...
+
+    def collide_begin(self, obj): ...
+
+    def collide_end(self, obj): ...
\ No newline at end of file
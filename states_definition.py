@@ -68,7 +68,7 @@ class State_Following(State):
             self.stateMachine.set_state("idle")
         else:
             # Pathfind towards this entity's pathfinding target position.
-            pathfindingVector = self.app.aStarPathfinder.pathfind(self.obj, self.obj.pathfindTarget, self.app.player)
+            pathfindingVector = self.app.aStarPathfinder.request_path(self.obj, self.obj.pathfindTarget, self.app.player)
             self.obj.rotation = pygame.math.Vector2().angle_to(pathfindingVector)
             # Adding some random variation in the entity's movements, looks more natural.
             pathfindingVector = pathfindingVector.rotate(random.uniform(-90, 90))
@@ -103,8 +103,10 @@ class State_Attacking(State):
 
     def update(self):
         # Wait for the timer to reach 0, if it does we can attack again.
-        self.timer -= 1
-        if self.timer == 0:
+        # Entities that are off screen aren't updated on every frame, so
+        # we count down by the number of frames since the last update.
+        self.timer -= self.obj.tickFrames
+        if self.timer <= 0:
             self.stateMachine.set_state("notAttacking")
 
 
@@ -125,8 +127,8 @@ class State_Skeleton_Dead(State):
         self.obj.animationManager.set("dead")
         # If the timer reaches 0, the skeleton revives itself and gets
         # back up.
-        self.timer -= 1
-        if self.timer == 0:
+        self.timer -= self.obj.tickFrames
+        if self.timer <= 0:
             self.obj.invulnerable = False
             self.obj.stateMachines["movement"].set_active(True)
             self.obj.stateMachines["attacks"].set_active(True)
@@ -159,7 +161,7 @@ class State_Python_Following(State):
                 self.obj.animationManager.get_frame_index() % 2 == 0 or not
                 self.obj.animationManager.currentAnimationObject.justChangedFrame
             ): return
-            pathfindingVector = self.app.aStarPathfinder.pathfind(self.obj, self.obj.pathfindTarget, self.app.player)
+            pathfindingVector = self.app.aStarPathfinder.request_path(self.obj, self.obj.pathfindTarget, self.app.player)
             self.obj.rotation = pygame.math.Vector2().angle_to(pathfindingVector)
             pathfindingVector = pathfindingVector.rotate(random.uniform(-20, 20))
             self.obj.accelerate(pathfindingVector * self.obj.speed)
@@ -174,7 +176,7 @@ class State_SporeCloud_Following(State):
         else:
             # Spore clouds move with a lot of randomness, but they still move in the general direction
             # of the player.
-            pathfindingVector = self.app.aStarPathfinder.pathfind(self.obj, self.obj.pathfindTarget, self.app.player)
+            pathfindingVector = self.app.aStarPathfinder.request_path(self.obj, self.obj.pathfindTarget, self.app.player)
             self.obj.rotation = pygame.math.Vector2().angle_to(pathfindingVector)
             pathfindingVector = pathfindingVector.rotate(random.uniform(-90, 90))
             pathfindingVector += pygame.math.Vector2(random.uniform(0, 6), 0).rotate(random.uniform(0, 360))
@@ -209,7 +211,7 @@ class State_Scientist_Running(State):
             # Pathfind towards a point in the opposite direction to the
             # player.
             pathfindTarget = self.obj.pos - (self.app.player.pos - self.obj.pos) * 10
-            pathfindingVector = self.app.aStarPathfinder.pathfind(
+            pathfindingVector = self.app.aStarPathfinder.request_path(
                 self.obj,
                 pathfindTarget,
                 self.app.player
@@ -351,7 +353,7 @@ class State_Chest_Closed(State):
     def enter(self):
         self.obj.animationManager.set("closed")
 
-    def collide(self, obj):
+    def collide_begin(self, obj):
         if obj == self.app.player:
             self.stateMachine.set_state("open")
             
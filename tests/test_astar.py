@@ -0,0 +1,60 @@
+import pygame
+
+from astar import *
+
+def make_pathfinder(nodeCount):
+    # Returns an AStarPathfinder with a graph of nodes in a straight line,
+    # each joined to the next one. Paths aren't precomputed, so every
+    # path is found by searching, and the path cache is used.
+    pathfinder = AStarPathfinder(None)
+    nodes = [pygame.math.Vector2(i * 10, 0) for i in range(nodeCount)]
+    edges = [(i, i + 1) for i in range(nodeCount - 1)]
+    pathfinder.setup_graph(nodes, edges, precomputePaths = False)
+    return pathfinder
+
+def test_path_cache_hits_and_misses():
+    pathfinder = make_pathfinder(5)
+    nodes = pathfinder.graph.nodes
+    assert pathfinder.nextHops is None
+    # The first time we ask for a path, it isn't in the cache.
+    firstNode = pathfinder.get_first_node_in_path(nodes[0], nodes[4])
+    assert firstNode is nodes[1]
+    assert pathfinder.pathCacheHits == 0
+    assert pathfinder.pathCacheMisses == 1
+    # The second time, the same node is returned from the cache.
+    assert pathfinder.get_first_node_in_path(nodes[0], nodes[4]) is firstNode
+    assert pathfinder.pathCacheHits == 1
+    assert pathfinder.pathCacheMisses == 1
+    # A path in the other direction is a different path.
+    assert pathfinder.get_first_node_in_path(nodes[4], nodes[0]) is nodes[3]
+    assert pathfinder.pathCacheMisses == 2
+
+def test_path_cache_evicts_least_recently_used_path():
+    # We need more than PATHCACHESIZE different paths, and a line of
+    # n nodes has n * (n - 1) of them.
+    nodeCount = 2
+    while nodeCount * (nodeCount - 1) <= PATHCACHESIZE: nodeCount += 1
+    pathfinder = make_pathfinder(nodeCount)
+    nodes = pathfinder.graph.nodes
+    paths = [(start, end) for start in nodes for end in nodes if start is not end]
+    # We find one more path than the cache can hold, so the first
+    # path we found should be forgotten.
+    for start, end in paths[:PATHCACHESIZE + 1]:
+        pathfinder.get_first_node_in_path(start, end)
+    assert len(pathfinder.pathCache) == PATHCACHESIZE
+    assert pathfinder.pathCacheMisses == PATHCACHESIZE + 1
+    firstStart, firstEnd = paths[0]
+    assert not (firstStart.index, firstEnd.index) in pathfinder.pathCache
+    # The second path is still cached, and using it makes it the most
+    # recently used, so finding another new path forgets the third one.
+    secondStart, secondEnd = paths[1]
+    pathfinder.get_first_node_in_path(secondStart, secondEnd)
+    assert pathfinder.pathCacheHits == 1
+    newStart, newEnd = paths[PATHCACHESIZE + 1]
+    pathfinder.get_first_node_in_path(newStart, newEnd)
+    assert (secondStart.index, secondEnd.index) in pathfinder.pathCache
+    thirdStart, thirdEnd = paths[2]
+    assert not (thirdStart.index, thirdEnd.index) in pathfinder.pathCache
+    # Asking for the first path again means searching for it again.
+    pathfinder.get_first_node_in_path(firstStart, firstEnd)
+    assert pathfinder.pathCacheMisses == PATHCACHESIZE + 3
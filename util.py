@@ -1,7 +1,15 @@
 import json
 
 WIDTH, HEIGHT = 400, 300
+# The maximum number of frames drawn per second.
 FPS = 60
+# The number of times per second the game is updated. This doesn't
+# depend on FPS - if frames are drawn more or less often than this,
+# the game is updated more or less than once per frame (see App.run()).
+TICKRATE = 60
+# The maximum number of updates in one frame. If the game falls further
+# behind than this, it slows down instead of trying to catch up.
+MAXTICKSPERFRAME = 5
 CAPTION = "<CATACOMB CRAWLER>"
 
 BLACK = 0, 0, 0
@@ -16,6 +24,70 @@ WHITE = 255, 255, 255
 # Grid size to use for collision check
 # optimisations.
 GRIDSIZE = 15
+# Boundaries have a radius of up to 150, so they
+# use a larger grid size.
+BOUNDARYGRIDSIZE = 60
+# Which method ObjectHandler uses to find pairs of nearby
+# moving objects. Either "grid" or "sweep".
+BROADPHASE = "grid"
+
+# Collision layers. Each class of object is on one of
+# these layers, and has a mask made up of the layers it
+# wants to know about collisions with (see Object).
+OBJECTLAYER = 1
+PLAYERLAYER = 2
+ENEMYLAYER = 4
+ITEMLAYER = 8
+EQUIPPEDLAYER = 16
+CHESTLAYER = 32
+EXITLAYER = 64
+
+# VerletObjects that are allowed to (see VerletObject.allowSleep)
+# fall asleep once their speed has stayed below SLEEPVELOCITY for
+# SLEEPFRAMES frames in a row. Sleeping objects aren't updated until
+# something wakes them up, like the player coming within
+# SLEEPWAKEDISTANCE of them.
+SLEEPVELOCITY = 0.05
+SLEEPFRAMES = 30
+SLEEPWAKEDISTANCE = 50
+# Objects further than this from the player aren't updated (see
+# ObjectHandler.update()). This should be larger than the distance
+# at which enemies notice the player, and the distance at which
+# objects' sounds can be heard.
+SIMULATIONRADIUS = 450
+# Entities that are off screen aren't updated on every frame (see
+# ObjectHandler.get_tick_interval()). Those within LODDISTANCE of the
+# player are updated every nearTickInterval frames, and those further
+# away every farTickInterval frames (see Object).
+LODDISTANCE = 250
+# Each level has a distance field (see BoundaryHandler.build_distance_field())
+# storing how far points are from the edge of the level, measured every
+# DISTANCEFIELDCELLSIZE pixels. Distances are only stored accurately up to
+# DISTANCEFIELDBAND pixels outside the level, which is much larger than any
+# object that is snapped inside the boundaries.
+DISTANCEFIELDCELLSIZE = 4
+DISTANCEFIELDBAND = 48
+# Whether VerletObjects are snapped inside the boundaries using the
+# distance field, instead of checking each nearby boundary.
+USEDISTANCEFIELD = True
+# When an object is checked against at least this many nearby boundaries,
+# BoundaryHandler.get_containment() checks them all at once with NumPy.
+# For fewer boundaries, checking them one at a time in Python is faster.
+CONTAINMENTNUMPYMINIMUM = 24
+# Whether AStarPathfinder works out the first step of the shortest path
+# between every pair of nodes when a level is loaded, so it doesn't need
+# to search for paths while the level is being played.
+PRECOMPUTEPATHS = True
+# The number of paths AStarPathfinder remembers the first step of, for
+# when paths aren't precomputed.
+PATHCACHESIZE = 256
+# Enemies ask AStarPathfinder for paths using request_path(), which answers
+# straight away with the last path found for them. Paths are then found
+# again at the end of the frame, for up to PATHFINDINGBUDGET milliseconds.
+# Requests that haven't been made for PATHREQUESTTIMEOUT frames are
+# forgotten.
+PATHFINDINGBUDGET = 1
+PATHREQUESTTIMEOUT = 60
 
 SAMPLERATE = 48000
 